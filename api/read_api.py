@@ -0,0 +1,271 @@
+"""Read-only JSON API over the trends, served from an in-memory snapshot.
+
+The snapshot is rebuilt when ``spike_aggregator`` sends ``NOTIFY trends_tick``
+(end of each tick) and at most every ``SNAPSHOT_REFRESH_SEC`` for the latest
+articles. Each response is serialised, gzipped and hashed once per rebuild,
+so a request is a dict lookup: Postgres is never queried per request.
+
+    GET /trends?kind=continu&window=60     GET /trends?kind=une&window=1440
+    GET /articles/latest?kind=une          GET /wiki/spikes
+    GET /health
+
+Every route takes ``?tenant=`` (default: first of ``TENANTS``).
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import psycopg2
+from aiohttp import web
+
+DBH = os.getenv("DB_HOST", "postgres")
+DBN = os.getenv("DB_NAME", "trends")
+DBU = os.getenv("DB_USER", "trends")
+DBP = os.getenv("DB_PASS", "trends")
+DBPORT = int(os.getenv("DB_PORT", "5432"))
+PORT = int(os.getenv("PORT", "8080"))
+NOTIFY_CHANNEL = os.getenv("NOTIFY_CHANNEL", "trends_tick")
+REFRESH_SEC = float(os.getenv("SNAPSHOT_REFRESH_SEC", "5"))
+LATEST_N = int(os.getenv("LATEST_N", "50"))   # ≤ HOT_N de db_writer (news_latest)
+FULL_REFRESH_SEC = float(os.getenv("FULL_REFRESH_SEC", "60"))   # si un NOTIFY se perd
+STALE_SEC = float(os.getenv("SNAPSHOT_STALE_SEC", "30"))         # /health en 503 au-delà
+TENANTS = [t.strip() for t in os.getenv("TENANTS", "fr").split(",") if t.strip()]
+
+# (kind, window en minutes) -> tag spikes_entities écrit par spike_aggregator
+TRENDS = {("continu", 60): "news_continu", ("une", 1440): "news_une"}
+DEFAULT_WINDOW = {kind: window for kind, window in TRENDS}
+KINDS = ("une", "continu")
+
+
+def log(msg: str) -> None:
+    print(f"{datetime.now(timezone.utc).isoformat()} [read-api] {msg}", flush=True)
+
+
+def connect():
+    for i in range(25):
+        try:
+            c = psycopg2.connect(host=DBH, dbname=DBN, user=DBU, password=DBP, port=DBPORT)
+            c.autocommit = True
+            return c
+        except psycopg2.OperationalError:
+            time.sleep(0.5 + i * 0.2)
+    return psycopg2.connect(host=DBH, dbname=DBN, user=DBU, password=DBP, port=DBPORT)
+
+
+class Payload:
+    """A JSON document ready to send: raw bytes, gzip bytes and ETag."""
+
+    __slots__ = ("body", "gz", "etag")
+
+    def __init__(self, obj):
+        self.body = json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+        self.gz = gzip.compress(self.body, 6)
+        self.etag = '"' + hashlib.blake2b(self.body, digest_size=8).hexdigest() + '"'
+
+
+# --- snapshot ----------------------------------------------------------------
+
+def rows(cur, sql, params=()):
+    cur.execute(sql, params)
+    cols = [c[0] for c in cur.description]
+    return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+
+def load_trends(cur) -> dict:
+    out = {}
+    for tenant in TENANTS:
+        for (kind, window), tag in TRENDS.items():
+            # le dernier lot : spike_aggregator purge les 5 dernières minutes avant d'écrire
+            items = rows(cur, """
+              SELECT phrase, mentions, sources, score
+              FROM spikes_entities
+              WHERE tenant=%s AND kind=%s
+                AND ts >= (SELECT MAX(ts) FROM spikes_entities WHERE tenant=%s AND kind=%s) - interval '5 minutes'
+              ORDER BY score DESC
+            """, (tenant, tag, tenant, tag))
+            out[f"{tenant}/trends/{kind}/{window}"] = Payload({"kind": kind, "window": window, "items": items})
+        items = rows(cur, """
+          SELECT page, edits_15m AS edits, score_norm AS score, ts
+          FROM spikes_wiki
+          WHERE tenant=%s AND ts = (SELECT MAX(ts) FROM spikes_wiki WHERE tenant=%s)
+          ORDER BY edits_15m DESC
+        """, (tenant, tenant))
+        out[f"{tenant}/wiki/spikes"] = Payload({"items": items})
+    return out
+
+
+def load_articles(cur) -> dict:
+    out = {}
+    for tenant in TENANTS:
+        both = []
+        for kind in KINDS:
+            items = rows(cur, """
+              SELECT published_ts, source, title, url
+              FROM news_latest
+              WHERE tenant=%s AND kind=%s
+              ORDER BY published_ts DESC
+              LIMIT %s
+            """, (tenant, kind, LATEST_N))
+            out[f"{tenant}/articles/{kind}"] = Payload({"kind": kind, "items": items})
+            both += [{**it, "kind": kind} for it in items]
+        both.sort(key=lambda it: it["published_ts"], reverse=True)
+        out[f"{tenant}/articles/all"] = Payload({"items": both[:LATEST_N]})
+    return out
+
+
+class Snapshot:
+    def __init__(self):
+        self.payloads = {}
+        self.refreshed_at = 0.0
+        self.db_refreshes = 0
+        self.requests = 0
+        self.dirty = asyncio.Event()
+
+    async def refresher(self):
+        """Rebuild on NOTIFY (trends + articles) or on timeout (articles only).
+
+        Connection failures are retried with backoff, like ``listener``: the
+        task must never die, or the API would serve a frozen snapshot.
+        """
+        conn = None
+        full, full_at, backoff = True, 0.0, 1.0
+        while True:
+            if conn is None:
+                try:
+                    conn = await asyncio.to_thread(connect)
+                    cur = conn.cursor()
+                    backoff = 1.0
+                except psycopg2.Error as exc:
+                    log(f"connexion impossible ({exc}) → nouvel essai dans {backoff:.0f}s")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 60)
+                    continue
+            try:
+                fresh = await asyncio.to_thread(load_articles, cur)
+                if full or time.time() - full_at > FULL_REFRESH_SEC:
+                    fresh.update(await asyncio.to_thread(load_trends, cur))
+                    full_at = time.time()
+                self.payloads = {**self.payloads, **fresh}   # swap, never mutate in place
+                self.refreshed_at = time.time()
+                self.db_refreshes += 1
+            except psycopg2.Error as exc:
+                log(f"rafraîchissement échoué : {exc}")
+                conn.close()
+                conn, full = None, True
+                continue
+            try:
+                await asyncio.wait_for(self.dirty.wait(), REFRESH_SEC)
+                full = True
+            except asyncio.TimeoutError:
+                full = False
+            self.dirty.clear()
+
+    async def listener(self):
+        """LISTEN on the aggregator channel, driven by the event loop (no thread).
+
+        A lost connection (Postgres restart…) is closed and reopened with
+        backoff; the snapshot is then rebuilt once, NOTIFYs may have been missed.
+        """
+        loop = asyncio.get_running_loop()
+        backoff, first = 1.0, True
+        while True:
+            try:
+                conn = await asyncio.to_thread(connect)
+                conn.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+            except psycopg2.Error as exc:
+                log(f"LISTEN impossible ({exc}) → nouvel essai dans {backoff:.0f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+            backoff = 1.0
+            if not first:
+                log("LISTEN rétabli")
+                self.dirty.set()
+            first = False
+            lost = loop.create_future()
+
+            def on_readable(conn=conn, lost=lost):
+                try:
+                    conn.poll()
+                except psycopg2.Error as exc:
+                    loop.remove_reader(conn.fileno())
+                    conn.close()
+                    if not lost.done():
+                        lost.set_result(exc)
+                    return
+                if conn.notifies:
+                    conn.notifies.clear()
+                    self.dirty.set()
+
+            loop.add_reader(conn.fileno(), on_readable)
+            log(f"connexion LISTEN perdue : {await lost}")
+
+
+SNAP = Snapshot()
+
+
+# --- HTTP --------------------------------------------------------------------
+
+def reply(request, key):
+    SNAP.requests += 1
+    key = f"{request.query.get('tenant', TENANTS[0])}/{key}"
+    p = SNAP.payloads.get(key)
+    if p is None:
+        raise web.HTTPNotFound(text=json.dumps({"error": f"inconnu : {key}"}), content_type="application/json")
+    headers = {"ETag": p.etag, "Cache-Control": f"public, max-age={int(REFRESH_SEC)}", "Vary": "Accept-Encoding"}
+    if p.etag in request.headers.get("If-None-Match", ""):
+        return web.Response(status=304, headers=headers)
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return web.Response(body=p.gz, content_type="application/json", charset="utf-8", headers=headers)
+    return web.Response(body=p.body, content_type="application/json", charset="utf-8", headers=headers)
+
+
+async def trends(request):
+    kind = request.query.get("kind", "continu")
+    window = request.query.get("window", str(DEFAULT_WINDOW.get(kind, "")))
+    return reply(request, f"trends/{kind}/{window}")
+
+
+async def articles_latest(request):
+    return reply(request, f"articles/{request.query.get('kind', 'all')}")
+
+
+async def wiki_spikes(request):
+    return reply(request, "wiki/spikes")
+
+
+async def health(request):
+    age = time.time() - SNAP.refreshed_at if SNAP.refreshed_at else None
+    stale = age is None or age > STALE_SEC
+    return web.json_response({
+        "status": "stale" if stale else "ok",
+        "snapshot_age_s": round(age, 1) if age is not None else None,
+        "db_refreshes": SNAP.db_refreshes,
+        "requests": SNAP.requests,
+        "trends": [f"kind={k}&window={w}" for k, w in TRENDS],
+        "tenants": TENANTS,
+    }, status=503 if stale else 200)
+
+
+async def start_background(app):
+    app["listener"] = asyncio.create_task(SNAP.listener())
+    app["refresher"] = asyncio.create_task(SNAP.refresher())
+
+
+def make_app():
+    app = web.Application()
+    app.router.add_get("/trends", trends)
+    app.router.add_get("/articles/latest", articles_latest)
+    app.router.add_get("/wiki/spikes", wiki_spikes)
+    app.router.add_get("/health", health)
+    app.on_startup.append(start_background)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(make_app(), port=PORT, access_log=None)
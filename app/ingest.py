@@ -1,8 +1,9 @@
-import os, time, hashlib, requests, feedparser
-from urllib.parse import urlparse
-from datetime import datetime, timezone, timedelta
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 import psycopg2
 from psycopg2.extras import execute_batch
+from common.sources import RssSource, WikiSource
 
 # ---------------- CONFIG ----------------
 DB_URL = os.getenv("DATABASE_URL")
@@ -10,9 +11,6 @@ if not DB_URL:
     DB_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASS')}@" \
              f"{os.getenv('DB_HOST')}:{os.getenv('DB_PORT','5432')}/{os.getenv('DB_NAME')}?sslmode=require"
 
-UA = "TrendsRealtimeBot/2.0 (+github.com/yominax/trends-realtime)"
-HDRS = {"User-Agent": UA}
-
 # RSS sources
 FEEDS_UNE = [
     "https://www.lemonde.fr/rss/une.xml",
@@ -32,24 +30,49 @@ FEEDS_CONTINU = [
 ]
 
 WIKI_DOMAIN = "fr.wikipedia.org"
-WIKI_URL = f"https://{WIKI_DOMAIN}/w/api.php"
+TENANT = "fr"
 
 DDL = """
 CREATE TABLE IF NOT EXISTS news_articles(
   id BIGSERIAL PRIMARY KEY,
   published_ts TIMESTAMPTZ NOT NULL,
   ts_ingest TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-  source TEXT, title TEXT, url TEXT UNIQUE, summary TEXT, kind TEXT
+  source TEXT, title TEXT, url TEXT, summary TEXT, kind TEXT
 );
-CREATE INDEX IF NOT EXISTS news_articles_published_idx ON news_articles(published_ts DESC);
-CREATE INDEX IF NOT EXISTS news_articles_kind_idx ON news_articles(kind, published_ts DESC);
+-- mêmes colonnes et index que db/migrate_04 à migrate_06
+ALTER TABLE news_articles ADD COLUMN IF NOT EXISTS tenant TEXT NOT NULL DEFAULT 'fr';
+ALTER TABLE news_articles ADD COLUMN IF NOT EXISTS url_canon TEXT;
+ALTER TABLE news_articles ADD COLUMN IF NOT EXISTS title_hash BIGINT;
+-- Index unique canonique : créé ici seulement sur une table vide. Base
+-- existante : db/dedup_news.py remplit url_canon, purge les doublons, le crée
+-- puis retire l'ancienne contrainte url UNIQUE, gardée jusque-là.
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM news_articles LIMIT 1) THEN
+    CREATE UNIQUE INDEX IF NOT EXISTS news_articles_canon_uniq ON news_articles(tenant, kind, url_canon);
+  END IF;
+  IF EXISTS (SELECT 1 FROM pg_index WHERE indexrelid = to_regclass('news_articles_canon_uniq') AND indisvalid) THEN
+    ALTER TABLE news_articles DROP CONSTRAINT IF EXISTS news_articles_url_key;
+  ELSE   -- en attendant : index simple pour le NOT EXISTS de SQL_INS_NEWS (retiré par dedup_news.py)
+    CREATE INDEX IF NOT EXISTS news_articles_canon_tmp ON news_articles(tenant, kind, url_canon);
+  END IF;
+END $$;
+CREATE INDEX IF NOT EXISTS news_articles_title_hash_idx ON news_articles(title_hash, source)
+  WHERE title_hash IS NOT NULL;
+CREATE INDEX IF NOT EXISTS news_articles_window_idx
+  ON news_articles(tenant, kind, published_ts DESC) INCLUDE (source, title, url);
+CREATE INDEX IF NOT EXISTS news_articles_published_brin
+  ON news_articles USING brin(published_ts) WITH (pages_per_range = 32);
 
 CREATE TABLE IF NOT EXISTS wiki_rc(
   id BIGSERIAL PRIMARY KEY,
   ts TIMESTAMPTZ NOT NULL,
   page TEXT, user_name TEXT, comment TEXT, delta INT, url TEXT
 );
-CREATE INDEX IF NOT EXISTS wiki_rc_ts_idx ON wiki_rc(ts DESC);
+ALTER TABLE wiki_rc ADD COLUMN IF NOT EXISTS tenant TEXT NOT NULL DEFAULT 'fr';
+ALTER TABLE wiki_rc ADD COLUMN IF NOT EXISTS ts_ingest TIMESTAMPTZ NOT NULL DEFAULT NOW();
+CREATE INDEX IF NOT EXISTS wiki_rc_window_idx ON wiki_rc(tenant, ts DESC) INCLUDE (page, delta, url);
+CREATE INDEX IF NOT EXISTS wiki_rc_ts_brin ON wiki_rc USING brin(ts) WITH (pages_per_range = 32);
 
 DO $$
 BEGIN
@@ -65,9 +88,13 @@ END $$;
 
 
 SQL_INS_NEWS = """
-INSERT INTO news_articles(published_ts, source, title, url, summary, kind)
-VALUES (%s,%s,%s,%s,%s,%s)
-ON CONFLICT (url) DO NOTHING;
+INSERT INTO news_articles(published_ts, source, title, url, summary, kind, tenant, url_canon, title_hash)
+SELECT %(ts)s, %(source)s, %(title)s, %(url)s, %(summary)s, %(kind)s, %(tenant)s, %(url_canon)s, %(title_hash)s
+WHERE NOT EXISTS (   -- clé canonique, même sans news_articles_canon_uniq (avant dedup_news.py)
+  SELECT 1 FROM news_articles
+  WHERE tenant = %(tenant)s AND kind = %(kind)s AND url_canon = %(url_canon)s
+)
+ON CONFLICT DO NOTHING;  -- news_articles_canon_uniq, ou l'ancienne url UNIQUE
 """
 SQL_INS_WIKI = """
 INSERT INTO wiki_rc(ts, page, user_name, comment, delta, url)
@@ -82,92 +109,43 @@ def conn():
 def log(msg):
     print(f"{datetime.now(timezone.utc).isoformat()} [ingest] {msg}", flush=True)
 
-# ---------------- RSS ----------------
-def fetch_rss(feed_list, kind):
-    rows = []
-    for u in feed_list:
+# ---------------- Sources ----------------
+# mêmes plugins que les producers (common/sources.py), lancés une fois
+def fetch_all(sources):
+    def one(src):
         try:
-            d = feedparser.parse(requests.get(u, headers=HDRS, timeout=20).content)
-            src = urlparse(u).netloc.replace("www.", "")
-            for e in d.entries[:50]:
-                ts = datetime.now(timezone.utc)
-                if e.get("published_parsed"):
-                    ts = datetime(*e.published_parsed[:6], tzinfo=timezone.utc)
-                rows.append((
-                    ts,
-                    src,
-                    (e.get("title","") or "").strip(),
-                    e.get("link",""),
-                    (e.get("summary","") or "")[:600],
-                    kind
-                ))
+            return src, list(src.fetch())
         except Exception as ex:
-            log(f"RSS fail {u}: {ex}")
-    return rows
-
-# ---------------- Wikipedia ----------------
-def fetch_wiki_recent():
-    params = {
-        "action": "query",
-        "format": "json",
-        "list": "recentchanges",
-        "rcprop": "title|user|comment|timestamp|sizes",
-        "rcnamespace": "0",
-        "rctype": "edit|new",
-        "rcshow": "!bot",
-        "rclimit": "20",
-        "rcdir": "newer"
-    }
-    try:
-        r = requests.get(WIKI_URL, params=params, timeout=20, headers=HDRS)
-        r.raise_for_status()
-        data = r.json()
-        rows = []
-        for rc in data.get("query", {}).get("recentchanges", []):
-            newlen = rc.get("newlen", 0)
-            oldlen = rc.get("oldlen", 0)
-            delta = int(newlen - oldlen)
-            ts = datetime.fromisoformat(rc["timestamp"].replace("Z", "+00:00"))
-            rows.append((
-                ts,
-                rc.get("title"),
-                rc.get("user"),
-                rc.get("comment"),
-                delta,
-                f"https://{WIKI_DOMAIN}/wiki/{(rc.get('title') or '').replace(' ', '_')}"
-            ))
-        return rows
-    except Exception as ex:
-        log(f"WIKI fail: {ex}")
-        return []
+            log(f"{src.name} fail: {ex}")
+            return src, []
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        return list(ex.map(one, sources))
+
+def to_ts(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc)
 
 # ---------------- MAIN ----------------
 def main():
     with conn() as c, c.cursor() as cur:
         cur.execute(DDL)
 
-    total_news = 0
-    total_wiki = 0
-
-    # UNE
-    une_rows = fetch_rss(FEEDS_UNE, "une")
-    with conn() as c, c.cursor() as cur:
-        execute_batch(cur, SQL_INS_NEWS, une_rows, page_size=200)
-    total_news += len(une_rows)
-
-    # CONTINU
-    cont_rows = fetch_rss(FEEDS_CONTINU, "continu")
-    with conn() as c, c.cursor() as cur:
-        execute_batch(cur, SQL_INS_NEWS, cont_rows, page_size=200)
-    total_news += len(cont_rows)
+    sources = [RssSource(u, kind="une", max_items=50) for u in FEEDS_UNE]
+    sources += [RssSource(u, kind="continu", max_items=50) for u in FEEDS_CONTINU]
+    sources.append(WikiSource(WIKI_DOMAIN, limit=20))
+    news_rows, wiki_rows = [], []
+    for src, recs in fetch_all(sources):
+        if isinstance(src, WikiSource):
+            wiki_rows += [(to_ts(r["ts"]), r["page"], r["user"], r["comment"], r["delta"], r["url"]) for r in recs]
+        else:
+            news_rows += [{"ts": to_ts(r["published_ts"]), "source": r["source"], "title": r["title"],
+                           "url": r["url"], "summary": r["summary"], "kind": src.kind, "tenant": TENANT,
+                           "url_canon": r["url_canon"] or None, "title_hash": r["title_hash"]} for r in recs]
 
-    # WIKIPEDIA
-    wiki_rows = fetch_wiki_recent()
     with conn() as c, c.cursor() as cur:
+        execute_batch(cur, SQL_INS_NEWS, news_rows, page_size=200)
         execute_batch(cur, SQL_INS_WIKI, wiki_rows, page_size=200)
-    total_wiki += len(wiki_rows)
 
-    log(f"Inserted: News={total_news}, Wiki={total_wiki}")
+    log(f"Inserted: News={len(news_rows)}, Wiki={len(wiki_rows)}")
 
 if __name__ == "__main__":
     main()
@@ -3,7 +3,6 @@ import pandas as pd
 import psycopg2, streamlit as st
 from io import BytesIO
 from wordcloud import WordCloud, STOPWORDS
-from PIL import Image
 
 # ---------- Config ----------
 DBH = os.getenv("DB_HOST", "postgres")
@@ -12,6 +11,7 @@ DBU = os.getenv("DB_USER", "trends")
 DBP = os.getenv("DB_PASS", "trends")
 DBPORT = int(os.getenv("DB_PORT", "5432"))
 REFRESH = int(os.getenv("REFRESH_SEC", "60"))
+TENANT = os.getenv("TENANT", "fr")   # marché affiché (cf. common/tenants.py)
 
 st.set_page_config(page_title="Trends Live, Médias FR MainStream", layout="wide")
  
@@ -111,76 +111,104 @@ def wc_from_titles(titles:list[str]):
     if not titles: return None
     text=" ".join(titles)
     wc=WordCloud(width=1000, height=360, background_color="white", collocations=False, stopwords=FR_STOP).generate(text)
-    buf=BytesIO(); wc.to_image().save(buf, format="PNG"); buf.seek(0)
-    return Image.open(buf)
+    buf=BytesIO(); wc.to_image().save(buf, format="PNG")
+    return buf.getvalue()
 
 # ---------- Requêtes utilitaires ----------
 def news_since(minutes:int, kind:str):
     return q("""
       SELECT published_ts AT TIME ZONE 'Europe/Paris' AS ts_local, source, title, url
       FROM news_articles
-      WHERE kind=%s AND published_ts >= NOW() - (%s || ' minutes')::interval
+      WHERE tenant=%s AND kind=%s AND published_ts >= NOW() - (%s || ' minutes')::interval
       ORDER BY published_ts DESC
-    """,[kind, minutes])
+    """,[TENANT, kind, minutes])
 
+# Flux direct : tables "chaudes" tenues par db_writer (HOT_N lignes par kind)
 def last_news(n:int=30, kind:str="une"):
     return q("""
       SELECT published_ts AT TIME ZONE 'Europe/Paris' AS ts_local, source, title, url
-      FROM news_articles
-      WHERE kind=%s
+      FROM news_latest
+      WHERE tenant=%s AND kind=%s
       ORDER BY published_ts DESC
       LIMIT %s
-    """,[kind, n])
+    """,[TENANT, kind, n])
 
 def wiki_last(n:int=20):
     return q("""
       SELECT ts AT TIME ZONE 'Europe/Paris' AS ts_local, page, delta, url
-      FROM wiki_rc
+      FROM wiki_latest
+      WHERE tenant=%s
       ORDER BY ts DESC
       LIMIT %s
-    """,[n])
+    """,[TENANT, n])
+
+# ---------- Détection de changement ----------
+# Un tampon de version par table, partagé entre sessions : une seule requête
+# par REFRESH quel que soit le nombre d'onglets ouverts. Les données/graphes
+# sont mis en cache par tampon et ne sont recalculés que si la table a changé.
+@st.cache_data(ttl=REFRESH, show_spinner=False)
+def stamp(table:str) -> int:
+    # MAX(id), lookup d'index ; un commit tardif sous le max est rattrapé par
+    # le créneau horaire de window_stamp
+    return int(q(f"SELECT COALESCE(MAX(id), 0) AS v FROM {table}")["v"].iloc[0])
+
+@st.cache_data(ttl=REFRESH, show_spinner=False)
+def hot_stamp(table:str) -> str:
+    # tables chaudes (HOT_N lignes) : empreinte de l'ensemble des ids, qui
+    # change à chaque rafraîchissement même si l'id entré est sous le max
+    return str(q(f"SELECT COALESCE(md5(string_agg(id::text, ',' ORDER BY id)), '') AS v FROM {table}")["v"].iloc[0])
+
+def window_stamp(minutes:int):
+    # les articles sortent aussi de la fenêtre avec le temps : ~1/60e de la fenêtre
+    return stamp("news_articles"), int(time.time() // max(60, minutes))
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def last_news_at(version, n:int, kind:str):
+    return last_news(n, kind)
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def wiki_last_at(version, n:int):
+    return wiki_last(n)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def trends_at(version, minutes:int, kind:str):
+    df = news_since(minutes, kind)
+    titles = df["title"].astype(str).tolist() if not df.empty else []
+    return compute_trends_df(titles), wc_from_titles(titles)
 
 # ===================== UI =====================
 
-tab_flux, tab_now, tab_1h, tab_24h = st.tabs(["Flux direct", "Analyse directe (10 min)", "1 h", "24 h"])
+def show_news(df):
+    if df.empty:
+        st.caption("— En attente…")
+    else:
+        for _,r in df.iterrows():
+            st.markdown(f"**[{r['source']}]** [{r['title']}]({r['url']}) — {r['ts_local']}")
 
-# --------- Flux direct ---------
-with tab_flux:
+def view_flux():
     c1, c2 = st.columns([1.1, 1])
     with c1:
         st.subheader("Derniers articles")
         col_une, col_cont = st.columns(2)
+        v = hot_stamp("news_latest")
         with col_une:
             st.caption("Flux UNE")
-            ln = last_news(20, "une")
-            if ln.empty:
-                st.caption("— En attente…")
-            else:
-                for _,r in ln.iterrows():
-                    st.markdown(f"**[{r['source']}]** [{r['title']}]({r['url']}) — {r['ts_local']}")
+            show_news(last_news_at(v, 20, "une"))
         with col_cont:
             st.caption("Flux continu")
-            lc = last_news(20, "continu")
-            if lc.empty:
-                st.caption("— En attente…")
-            else:
-                for _,r in lc.iterrows():
-                    st.markdown(f"**[{r['source']}]** [{r['title']}]({r['url']}) — {r['ts_local']}")
+            show_news(last_news_at(v, 20, "continu"))
     with c2:
         st.subheader("Derniers événements Wikipedia")
-        lw = wiki_last(25)
+        lw = wiki_last_at(hot_stamp("wiki_latest"), 25)
         if lw.empty:
             st.caption("— En attente d’événements…")
         else:
             for _,r in lw.iterrows():
                 st.markdown(f"**WIKI** [{r['page']}]({r['url']}) — Δ {int(r['delta'])} — {r['ts_local']}")
 
-# --------- Analyse directe (10 min) ---------
-with tab_now:
+def view_now():
     st.subheader("Top flux continu (10 min)")
-    now_df = news_since(10, "continu")
-    titles = now_df["title"].astype(str).tolist() if not now_df.empty else []
-    trends_now = compute_trends_df(titles)
+    trends_now, img = trends_at(window_stamp(10), 10, "continu")
     if trends_now.empty:
         st.info("En attente de tendances…")
     else:
@@ -189,33 +217,40 @@ with tab_now:
         for i,(idx,row) in enumerate(top3.iterrows()):
             c[i].metric(label=f"#{i+1}", value=row["phrase"], delta=int(row["score"]))
         st.bar_chart(trends_now.head(12).set_index("phrase")["score"], use_container_width=True)
-        img = wc_from_titles(titles)
         if img: st.image(img, caption="WordCloud — 10 min", use_container_width=True)
 
-# --------- 1 h ---------
-with tab_1h:
+def view_1h():
     st.subheader("Tendances flux continu — 60 min")
-    df1 = news_since(60, "continu")
-    titles1 = df1["title"].astype(str).tolist() if not df1.empty else []
-    t1 = compute_trends_df(titles1)
+    t1, img1 = trends_at(window_stamp(60), 60, "continu")
     if t1.empty:
         st.info("En attente de tendances (1 h)…")
     else:
         st.bar_chart(t1.head(20).set_index("phrase")["score"], use_container_width=True)
-        img1 = wc_from_titles(titles1)
         if img1: st.image(img1, caption="WordCloud — 1 h", use_container_width=True)
 
-# --------- 24 h ---------
-with tab_24h:
+def view_24h():
     st.subheader("Tendances flux UNE — 24 h")
-    dfD = news_since(1440, "une")
-    titlesD = dfD["title"].astype(str).tolist() if not dfD.empty else []
-    tD = compute_trends_df(titlesD)
+    tD, imgD = trends_at(window_stamp(1440), 1440, "une")
     if tD.empty:
         st.info("En attente de tendances (24 h)…")
     else:
         st.bar_chart(tD.head(25).set_index("phrase")["score"], use_container_width=True)
-        imgD = wc_from_titles(titlesD)
         if imgD: st.image(imgD, caption="WordCloud — 24 h", use_container_width=True)
 
-st.caption(f"Auto-refresh {REFRESH}s"); time.sleep(REFRESH); st.rerun()
+VIEWS = {
+    "Flux direct": view_flux,
+    "Analyse directe (10 min)": view_now,
+    "1 h": view_1h,
+    "24 h": view_24h,
+}
+
+# Seule la vue active est calculée ; le fragment se relance seul toutes les
+# REFRESH s sans réexécuter la page ni bloquer un thread en sleep.
+view = st.radio("Vue", list(VIEWS), horizontal=True, label_visibility="collapsed")
+
+@st.fragment(run_every=REFRESH)
+def live(view:str):
+    VIEWS[view]()
+
+live(view)
+st.caption(f"Auto-refresh {REFRESH}s")
@@ -0,0 +1,160 @@
+"""``EXPLAIN (ANALYZE, BUFFERS)`` of the dashboard and aggregator queries.
+
+Capture the plans before and after an index migration, then compare:
+
+    python -m bench.explain capture --label before --out /out/explain_before.json
+    docker compose exec postgres psql -U trends -d trends -f /docker-entrypoint-initdb.d/06_indexes.sql
+    python -m bench.explain capture --label after --out /out/explain_after.json
+    python -m bench.explain compare /out/explain_before.json /out/explain_after.json
+
+The aggregator's statements are recorded by calling its own functions with a
+cursor that only records SQL, so they cannot drift from the service. The
+dashboard cannot be imported without starting Streamlit: its queries are
+copied below and must follow ``app/streamlit_app.py``. Writes (INSERT /
+DELETE of the aggregator) run inside a rolled-back transaction.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+from bench.generate import ROOT
+from bench.harness import connect, log
+from common.profiling import explain_analyze
+
+TENANT = os.getenv("TENANT", "fr")
+
+# app/streamlit_app.py
+NEWS_SINCE = """
+  SELECT published_ts AT TIME ZONE 'Europe/Paris' AS ts_local, source, title, url
+  FROM news_articles
+  WHERE tenant=%s AND kind=%s AND published_ts >= NOW() - (%s || ' minutes')::interval
+  ORDER BY published_ts DESC
+"""
+LAST_NEWS = """
+  SELECT published_ts AT TIME ZONE 'Europe/Paris' AS ts_local, source, title, url
+  FROM news_latest
+  WHERE tenant=%s AND kind=%s
+  ORDER BY published_ts DESC
+  LIMIT %s
+"""
+WIKI_LAST = """
+  SELECT ts AT TIME ZONE 'Europe/Paris' AS ts_local, page, delta, url
+  FROM wiki_latest
+  WHERE tenant=%s
+  ORDER BY ts DESC
+  LIMIT %s
+"""
+STAMP = "SELECT COALESCE(MAX(id), 0) AS v FROM {}"
+HOT_STAMP = "SELECT COALESCE(md5(string_agg(id::text, ',' ORDER BY id)), '') AS v FROM {}"
+
+
+class Recorder:
+    """Cursor stand-in that records statements instead of running them."""
+
+    def __init__(self):
+        self.calls = []
+
+    def execute(self, sql, params=None):
+        self.calls.append((sql, params))
+
+    def fetchall(self):
+        return []
+
+
+def dashboard_queries():
+    return [
+        ("ui.news_since continu 60", NEWS_SINCE, [TENANT, "continu", 60]),
+        ("ui.news_since une 1440", NEWS_SINCE, [TENANT, "une", 1440]),
+        ("ui.last_news une 20", LAST_NEWS, [TENANT, "une", 20]),
+        ("ui.last_news continu 20", LAST_NEWS, [TENANT, "continu", 20]),
+        ("ui.wiki_last 25", WIKI_LAST, [TENANT, 25]),
+        ("ui.stamp news_articles", STAMP.format("news_articles"), None),
+        ("ui.hot_stamp news_latest", HOT_STAMP.format("news_latest"), None),
+        ("ui.hot_stamp wiki_latest", HOT_STAMP.format("wiki_latest"), None),
+    ]
+
+
+def aggregator_queries():
+    sys.path.insert(0, os.path.join(ROOT, "consumers", "spike_aggregator"))
+    import spike_aggregator as agg
+
+    out = []
+    for name, call in (("agg.news_spikes", lambda c: agg.news_spikes(c, TENANT)),
+                       ("agg.wiki_spikes", lambda c: agg.wiki_spikes(c, agg.WIKI_WINDOW, TENANT))):
+        rec = Recorder()
+        call(rec)
+        for i, (sql, params) in enumerate(rec.calls, 1):
+            out.append((f"{name}#{i}", sql, params))
+    return out
+
+
+def summarize(plan) -> dict:
+    text = "\n".join(plan)
+    ms = lambda label: float(m.group(1)) if (m := re.search(label + r": ([\d.]+) ms", text)) else None
+    buf = re.search(r"Buffers: shared(?: hit=(\d+))?(?: read=(\d+))?", text)
+    scans = re.findall(r"((?:Index Only|Bitmap Heap|Bitmap Index|Index|Seq) Scan(?: Backward)?"
+                       r"(?: using \S+)?(?: on \S+)?)", text)
+    return {
+        "execution_ms": ms("Execution Time"),
+        "planning_ms": ms("Planning Time"),
+        "shared_hit": int(buf.group(1) or 0) if buf else 0,
+        "shared_read": int(buf.group(2) or 0) if buf else 0,
+        "scans": list(dict.fromkeys(scans)),
+    }
+
+
+def capture(args) -> None:
+    conn = connect()
+    queries = dashboard_queries() + aggregator_queries()
+    report = {"label": args.label, "ts": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "queries": {}}
+    for name, sql, params in queries:
+        runs = [explain_analyze(conn, sql, params) for _ in range(args.repeat)]
+        stats = [summarize(p) for p in runs]
+        last = stats[-1]
+        times = [s["execution_ms"] for s in stats if s["execution_ms"] is not None]
+        last["execution_ms"] = round(statistics.median(times), 3) if times else None
+        report["queries"][name] = {"sql": " ".join(sql.split()), "params": params, "plan": runs[-1], **last}
+        log(f"{name:<28} {last['execution_ms']} ms  hit={last['shared_hit']} read={last['shared_read']}")
+        for line in runs[-1]:
+            print(f"    {line}")
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    log(f"plans écrits dans {args.out}")
+
+
+def compare(args) -> None:
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    print(f"{'requête':<28} {before['label']:>10} {after['label']:>10}   buffers (hit+read)   scans ({after['label']})")
+    for name, a in after["queries"].items():
+        b = before["queries"].get(name, {})
+        buf = lambda q: (q.get("shared_hit", 0) + q.get("shared_read", 0)) if q else "-"
+        print(f"{name:<28} {str(b.get('execution_ms', '-')):>10} {str(a['execution_ms']):>10}   "
+              f"{buf(b):>8} → {buf(a):<8}   {'; '.join(a['scans'])}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="EXPLAIN (ANALYZE, BUFFERS) des requêtes du dashboard et de l'agrégateur")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("capture", help="exécute et enregistre les plans")
+    c.add_argument("--label", default="before")
+    c.add_argument("--repeat", type=int, default=3, help="exécutions par requête (médiane)")
+    c.add_argument("--out", default="explain.json")
+    d = sub.add_parser("compare", help="compare deux captures")
+    d.add_argument("before")
+    d.add_argument("after")
+    args = ap.parse_args()
+    if args.cmd == "capture":
+        capture(args)
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Synthetic French headline and Wikipedia edit streams for the benchmarks.
+
+Sources are the hosts of ``producers/news/feeds*.txt``; words are drawn from a
+fixed vocabulary with Zipfian weights so that a few terms dominate, like a
+real news cycle. Everything is seeded: the same ``--seed`` gives the same
+stream.
+
+    python -m bench.generate feeds            # (re)write bench/feeds_*.txt
+    python -m bench.generate sample -n 20     # print headlines as JSONL
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import time
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FEED_FILES = {
+    "une": os.path.join(ROOT, "producers", "news", "feeds.txt"),
+    "continu": os.path.join(ROOT, "producers", "news", "feeds_continu.txt"),
+}
+
+ENTITIES = """
+Emmanuel Macron|Michel Barnier|Marine Le Pen|Jean-Luc Mélenchon|Gabriel Attal|Anne Hidalgo
+Union Européenne|Assemblée Nationale|Conseil Constitutionnel|Banque Centrale Européenne
+Paris Saint-Germain|Olympique Marseille|Roland Garros|Tour de France|Coupe du Monde
+Donald Trump|Vladimir Poutine|Volodymyr Zelensky|Joe Biden|Xi Jinping|Ursula von der Leyen
+Météo France|Air France|SNCF Réseau|Renault Group|TotalEnergies|Banque de France
+""".replace("\n", "|").split("|")
+ENTITIES = [e.strip() for e in ENTITIES if e.strip()]
+
+NOUNS = """
+gouvernement réforme retraites budget grève inflation élections sondage ministre président
+guerre Ukraine Gaza Israël Russie Chine accord sommet négociations sanctions frontière
+tempête inondations canicule incendie séisme alerte vigilance pluie orages neige
+match victoire défaite finale championnat transfert entraîneur joueur saison record
+police enquête procès tribunal justice attentat agression arrestation prison témoin
+santé hôpital vaccin épidémie médecins urgences patients grippe covid pénurie
+économie croissance chômage entreprises salaires prix carburant énergie électricité
+climat pollution nucléaire éoliennes agriculture agriculteurs eau sécheresse
+école université étudiants enseignants bac rentrée éducation examens
+intelligence artificielle numérique cyberattaque données réseaux smartphone
+""".split()
+
+VERBS = """
+annonce dévoile confirme dément prépare lance suspend rejette valide menace
+critique défend promet réclame propose adopte reporte signe quitte rejoint
+""".split()
+
+ADJS = """
+nouvelle nouveau historique inédit majeur grave urgent national européen mondial
+record massive forte violente politique économique sociale
+""".split()
+
+TEMPLATES = (
+    "{E} {v} {n} {a}",
+    "{n} : {E} {v} {n}",
+    "{n} {a} : {n} et {n}",
+    "{E} face à {n} {a}",
+    "{n} : ce que {v} {E}",
+    "En direct - {n} : {E} {v} {n}",
+    "{n} {a}, {n} {a}",
+)
+
+
+class Zipf:
+    """Draw items with weight 1/rank**s (first item is the most frequent)."""
+
+    def __init__(self, items, s: float = 1.1, rng=None):
+        self.items = list(items)
+        weights = [1.0 / (r ** s) for r in range(1, len(self.items) + 1)]
+        self.cum = list(itertools.accumulate(weights))
+        self.rng = rng or random.Random()
+
+    def __call__(self) -> str:
+        return self.rng.choices(self.items, cum_weights=self.cum, k=1)[0]
+
+
+def load_sources(kind: str):
+    """Distinct hosts of a feed file, in file order (same rule as ``pull_feed``)."""
+    hosts = []
+    with open(FEED_FILES[kind], encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            h = urlparse(line).netloc.replace("www.", "")
+            if h not in hosts:
+                hosts.append(h)
+    return hosts
+
+
+def feed_url(host: str, kind: str) -> str:
+    # plain http: the stub is reached through HTTP_PROXY, so no TLS involved
+    return f"http://{host}/bench/{kind}.xml"
+
+
+class HeadlineGenerator:
+    """Endless stream of news records shaped like ``news_producer`` output."""
+
+    def __init__(self, kind: str = "continu", seed: int = 0, s: float = 1.1):
+        self.kind = kind
+        self.rng = random.Random(f"{seed}-{kind}")
+        self.sources = load_sources(kind)
+        self.source = Zipf(self.sources, 0.6, self.rng)
+        self.entity = Zipf(self.rng.sample(ENTITIES, len(ENTITIES)), s, self.rng)
+        self.noun = Zipf(self.rng.sample(NOUNS, len(NOUNS)), s, self.rng)
+        self.verb = Zipf(VERBS, s, self.rng)
+        self.adj = Zipf(ADJS, s, self.rng)
+        self.seq = itertools.count(1)
+
+    def title(self) -> str:
+        draw = {"E": self.entity, "n": self.noun, "v": self.verb, "a": self.adj}
+        t = re.sub(r"\{(\w)\}", lambda m: draw[m.group(1)](), self.rng.choice(TEMPLATES))
+        return t[:1].upper() + t[1:]
+
+    def record(self, title=None, source=None, ts=None) -> dict:
+        n = next(self.seq)
+        source = source or self.source()
+        return {
+            "published_ts": int(ts if ts is not None else time.time()),
+            "source": source,
+            "title": title or self.title(),
+            "url": f"https://{source}/bench/{self.kind}/{n}",
+            "summary": "",
+            "kind": self.kind,
+        }
+
+
+class WikiEditGenerator:
+    """Stream of recentchanges entries (action API shape) over Zipfian pages."""
+
+    def __init__(self, seed: int = 0, s: float = 1.2, pages: int = 2000):
+        self.rng = random.Random(f"{seed}-wiki")
+        names = ENTITIES + [n.capitalize() for n in NOUNS]
+        titles = [names[i % len(names)] + ("" if i < len(names) else f" ({i})") for i in range(pages)]
+        self.page = Zipf(self.rng.sample(titles, len(titles)), s, self.rng)
+        self.rcid = itertools.count(1)
+
+    def change(self, ts=None) -> dict:
+        ts = ts if ts is not None else time.time()
+        old = self.rng.randint(500, 50000)
+        return {
+            "rcid": next(self.rcid),
+            "type": "edit",
+            "title": self.page(),
+            "user": f"Bench{self.rng.randint(1, 500)}",
+            "comment": "",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts)),
+            "oldlen": old,
+            "newlen": old + int(self.rng.gauss(0, 300)),
+        }
+
+
+def probe_phrase(i: int, seed: int = 0) -> str:
+    """Unique capitalised two-word entity used to time ingest-to-trend."""
+    rng = random.Random(f"probe-{seed}-{i}")
+    syl = ("ka", "zo", "ri", "mel", "tor", "vax", "qui", "lun", "bre", "dov")
+    word = lambda: "".join(rng.choice(syl) for _ in range(3)).capitalize()
+    return f"{word()} {word()}"
+
+
+def write_feed_lists(out_dir: str) -> None:
+    for kind in FEED_FILES:
+        path = os.path.join(out_dir, f"feeds_{kind}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"# généré par python -m bench.generate feeds ({kind})\n")
+            for h in load_sources(kind):
+                f.write(feed_url(h, kind) + "\n")
+        print(path)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    f = sub.add_parser("feeds", help="écrit les listes de flux pointant vers le stub")
+    f.add_argument("--out", default=os.path.join(ROOT, "bench"))
+    s = sub.add_parser("sample", help="affiche des titres générés (JSONL)")
+    s.add_argument("-n", type=int, default=20)
+    s.add_argument("--kind", default="continu", choices=list(FEED_FILES))
+    s.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    if args.cmd == "feeds":
+        write_feed_lists(args.out)
+    else:
+        gen = HeadlineGenerator(args.kind, args.seed)
+        for _ in range(args.n):
+            print(json.dumps(gen.record(), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+"""End-to-end and per-stage benchmarks for the trends pipeline.
+
+Stages:
+
+- ``e2e``        stubs → producers → Kafka → db_writer → Postgres → spike_aggregator.
+                 Probe headlines (unique entity) are injected in the stub feeds;
+                 ingest-to-trend latency runs from publication in the feed to
+                 the moment the probe's entity is first seen in
+                 ``spikes_entities``, then in the ``read_api`` payload. Each
+                 probe is published often enough to enter the top 50 (see
+                 ``probe_copies``); the run fails if no probe ever does.
+- ``producer``   stubs → news_producer → Kafka, measured with our own consumer.
+- ``db_writer``  synthetic records sent straight to Kafka at ``--rate``,
+                 measured on ``news_articles`` (rows/s, publish → row latency).
+- ``aggregator`` seeds ``news_articles`` with ``--rows`` titles and times
+                 ``spike_aggregator.tick`` in-process.
+- ``api``        load test of ``read_api`` (``--concurrency`` clients); checks
+                 via ``/health`` that the DB is only hit per snapshot refresh.
+
+Memory is read from each service's ``/metrics`` (``process_resident_memory_bytes``,
+see ``METRICS_URLS``), or from this process for in-process stages.
+
+Meant to run inside ``bench/docker-compose.bench.yml`` (fully offline), e.g.
+
+    python -m bench.harness e2e --duration 300 --probes 10
+    python -m bench.harness aggregator --rows 200000 --ticks 5
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import sys
+import time
+
+import psycopg2
+import requests
+from psycopg2.extras import execute_values
+
+from bench.generate import ROOT, HeadlineGenerator, probe_phrase
+from bench.stubs import FEED_DEPTH, StubServer
+
+BOOT = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:29092")
+TOPIC_NEWS = os.getenv("TOPIC_NEWS", "news_fr")
+DBH = os.getenv("DB_HOST", "postgres")
+DBN = os.getenv("DB_NAME", "trends")
+DBU = os.getenv("DB_USER", "trends")
+DBP = os.getenv("DB_PASS", "trends")
+DBPORT = int(os.getenv("DB_PORT", "5432"))
+STUB_PORT = int(os.getenv("STUB_PORT", "8080"))
+API_URL = os.getenv("API_URL", "http://read-api:8080")
+# "db-writer=http://db-writer:8000/metrics,news-producer=http://..."
+METRICS_URLS = dict(
+    kv.split("=", 1) for kv in os.getenv("METRICS_URLS", "").split(",") if "=" in kv
+)
+
+SEED_URL = "https://bench.seed/"
+PROBE_MARGIN = 1.5   # le seuil du top 50 monte encore avant que la sonde soit comptée
+
+
+def log(msg: str) -> None:
+    print(f"[bench] {msg}", file=sys.stderr, flush=True)
+
+
+def connect():
+    for i in range(30):
+        try:
+            c = psycopg2.connect(host=DBH, dbname=DBN, user=DBU, password=DBP, port=DBPORT)
+            c.autocommit = True
+            return c
+        except psycopg2.OperationalError:
+            time.sleep(1)
+    return psycopg2.connect(host=DBH, dbname=DBN, user=DBU, password=DBP, port=DBPORT)
+
+
+def pct(xs, p: float):
+    """Nearest-rank percentile (None on empty input)."""
+    if not xs:
+        return None
+    xs = sorted(xs)
+    return round(xs[min(len(xs) - 1, max(0, int(round(p / 100 * len(xs))) - 1))], 3)
+
+
+def latency_stats(xs) -> dict:
+    return {"n": len(xs), "p50": pct(xs, 50), "p99": pct(xs, 99), "max": pct(xs, 100)}
+
+
+def service_memory() -> dict:
+    out = {}
+    for name, url in METRICS_URLS.items():
+        try:
+            for line in requests.get(url, timeout=2).text.splitlines():
+                if line.startswith("process_resident_memory_bytes"):
+                    out[name] = round(float(line.split()[-1]) / 2**20, 1)
+        except requests.RequestException:
+            out[name] = None
+    return out
+
+
+def self_memory() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def max_news_id(cur) -> int:
+    cur.execute("SELECT COALESCE(MAX(id), 0) FROM news_articles")
+    return cur.fetchone()[0]
+
+
+def db_progress(cur, start_id: int):
+    """Rows written since ``start_id`` and their publish → insert latencies."""
+    cur.execute("""
+      SELECT EXTRACT(EPOCH FROM ts_ingest - published_ts)
+      FROM news_articles WHERE id > %s AND url NOT LIKE %s
+    """, (start_id, SEED_URL + "%"))
+    return [float(r[0]) for r in cur.fetchall()]
+
+
+# --- stages ----------------------------------------------------------------
+
+def probe_copies(cur, args, sources: int) -> int:
+    """Copies needed for a probe entity (3 points each) to beat the current top-50 floor."""
+    cur.execute("""
+      SELECT COALESCE(MIN(mentions), 0) FROM spikes_entities
+      WHERE kind = 'news_continu'
+        AND ts >= (SELECT MAX(ts) FROM spikes_entities WHERE kind = 'news_continu') - interval '5 minutes'
+    """)
+    floor = cur.fetchone()[0]
+    need = max(args.probe_copies, math.ceil(floor * PROBE_MARGIN / 3))
+    cap = sources * FEED_DEPTH // 2   # au-delà, les flux RSS perdraient des copies avant la collecte
+    if need > cap:
+        log(f"sonde : {need} copies nécessaires (seuil {floor}), plafonnées à {cap}")
+    return min(need, cap)
+
+
+def run_e2e(args) -> dict:
+    stub = StubServer(STUB_PORT, {"une": args.rate_une, "continu": args.rate_continu,
+                                  "wiki": args.rate_wiki}, args.seed).start()
+    gen = HeadlineGenerator("continu", args.seed + 1)
+    cur = connect().cursor()
+    log(f"warmup {args.warmup}s")
+    time.sleep(args.warmup)
+    start_id, t_start = max_news_id(cur), time.time()
+
+    # phrase -> emitted at, then first seen in news_articles / spikes_entities / API
+    probes, to_db, to_trend, to_api, copies = {}, [], [], [], []
+    api_ok = True
+    every = args.duration / max(args.probes, 1)
+    next_probe, i = t_start, 0
+    deadline = t_start + args.duration
+    missing = lambda step: [ph for ph, p in probes.items() if p[step] is None]
+    while time.time() < deadline + args.settle and (
+            time.time() < deadline or missing("trend") or (api_ok and missing("api"))):
+        now = time.time()
+        if now < deadline and now >= next_probe and i < args.probes:
+            phrase = probe_phrase(i, args.seed)
+            n = probe_copies(cur, args, len(gen.sources))
+            copies.append(n)
+            # " : " keeps CAP_SEQ from gluing the probe to the next word; the number
+            # makes each copy a distinct (source, title) for the dedup, without
+            # adding words to the counts
+            t_emit = stub.inject("continu", [f"{phrase} : {k}" for k in range(n)])
+            probes[phrase] = {"emit": t_emit, "db": None, "trend": None, "api": None}
+            i += 1
+            next_probe += every
+        if missing("db"):
+            cur.execute("""
+              SELECT DISTINCT split_part(title, ' : ', 1)
+              FROM news_articles WHERE id > %s AND split_part(title, ' : ', 1) = ANY(%s)
+            """, (start_id, missing("db")))
+            for (phrase,) in cur.fetchall():
+                probes[phrase]["db"] = time.time()
+                to_db.append(probes[phrase]["db"] - probes[phrase]["emit"])
+        if missing("trend"):
+            cur.execute("""
+              SELECT DISTINCT phrase FROM spikes_entities
+              WHERE kind = 'news_continu' AND phrase = ANY(%s)
+            """, (missing("trend"),))
+            for (phrase,) in cur.fetchall():
+                probes[phrase]["trend"] = time.time()
+                to_trend.append(probes[phrase]["trend"] - probes[phrase]["emit"])
+        if api_ok and missing("api"):
+            try:
+                items = requests.get(API_URL + "/trends?kind=continu&window=60", timeout=2).json()["items"]
+            except (requests.RequestException, ValueError, KeyError) as exc:
+                log(f"read_api injoignable ({exc}) : latence API non mesurée")
+                api_ok = False
+            else:
+                seen = {it["phrase"] for it in items}
+                for phrase in missing("api"):
+                    if phrase in seen:
+                        probes[phrase]["api"] = time.time()
+                        to_api.append(probes[phrase]["api"] - probes[phrase]["emit"])
+        time.sleep(0.25)
+    elapsed = time.time() - t_start
+    db_lat = db_progress(cur, start_id)
+    stub.stop()
+    failed = bool(probes) and len(missing("trend")) == len(probes)
+    if failed:
+        log(f"aucune des {len(probes)} sondes n'a atteint spikes_entities : latence ingest → tendance non mesurée")
+    return {
+        "stage": "e2e",
+        "failed": failed,
+        "duration_s": round(elapsed, 1),
+        "generated_per_s": args.rate_une + args.rate_continu,
+        "throughput_rows_per_s": round(len(db_lat) / elapsed, 1),
+        "ingest_to_db_s": latency_stats(to_db),
+        "ingest_to_trend_s": latency_stats(to_trend),
+        "ingest_to_api_s": latency_stats(to_api) if api_ok else None,
+        "probe_copies": {"min": min(copies), "max": max(copies)} if copies else None,
+        "probes_missed": len(missing("trend")),
+        "probes_missed_api": len(missing("api")) if api_ok else None,
+        "publish_to_db_s": latency_stats(db_lat),
+        "stub_requests": dict(stub.requests),
+        "memory_mb": service_memory(),
+    }
+
+
+def run_producer(args) -> dict:
+    from kafka import KafkaConsumer
+
+    stub = StubServer(STUB_PORT, {"une": args.rate_une, "continu": args.rate_continu,
+                                  "wiki": args.rate_wiki}, args.seed).start()
+    consumer = KafkaConsumer(TOPIC_NEWS, bootstrap_servers=BOOT, auto_offset_reset="latest",
+                             value_deserializer=lambda v: json.loads(v.decode("utf-8")))
+    time.sleep(args.warmup)
+    lat, t_start = [], time.time()
+    while time.time() < t_start + args.duration:
+        for msgs in consumer.poll(timeout_ms=500).values():
+            now = time.time()
+            lat.extend(now - m.value.get("published_ts", now) for m in msgs)
+    elapsed = time.time() - t_start
+    stub.stop()
+    return {
+        "stage": "producer",
+        "duration_s": round(elapsed, 1),
+        "generated_per_s": args.rate_une + args.rate_continu,
+        "throughput_records_per_s": round(len(lat) / elapsed, 1),
+        "publish_to_kafka_s": latency_stats(lat),
+        "stub_requests": dict(stub.requests),
+        "memory_mb": service_memory(),
+    }
+
+
+def run_db_writer(args) -> dict:
+    from kafka import KafkaProducer
+
+    prod = KafkaProducer(bootstrap_servers=BOOT, linger_ms=5,
+                         value_serializer=lambda v: json.dumps(v, ensure_ascii=False).encode("utf-8"))
+    gen = HeadlineGenerator("continu", args.seed)
+    cur = connect().cursor()
+    start_id, t_start = max_news_id(cur), time.time()
+    sent = 0
+    while time.time() < t_start + args.duration:
+        # pace to --rate, catching up if a send blocked
+        due = int((time.time() - t_start) * args.rate)
+        for _ in range(due - sent):
+            prod.send(TOPIC_NEWS, gen.record(ts=time.time()))
+        sent = max(sent, due)
+        time.sleep(0.01)
+    prod.flush()
+    t_sent = time.time()
+    # drain: wait until the row count stops moving
+    last, stable_since = -1, time.time()
+    while time.time() - stable_since < 5 and time.time() - t_sent < args.settle:
+        n = max_news_id(cur)
+        if n != last:
+            last, stable_since = n, time.time()
+        time.sleep(0.5)
+    lat = db_progress(cur, start_id)
+    elapsed = time.time() - t_start
+    return {
+        "stage": "db_writer",
+        "duration_s": round(elapsed, 1),
+        "sent": sent,
+        "written": len(lat),
+        "throughput_rows_per_s": round(len(lat) / elapsed, 1),
+        "publish_to_db_s": latency_stats(lat),
+        "memory_mb": service_memory(),
+    }
+
+
+def run_aggregator(args) -> dict:
+    sys.path.insert(0, os.path.join(ROOT, "consumers", "spike_aggregator"))
+    from prometheus_client import REGISTRY
+    import spike_aggregator as agg
+
+    conn = connect()
+    cur = conn.cursor()
+    now = time.time()
+    for kind, share in (("continu", 0.7), ("une", 0.3)):
+        gen = HeadlineGenerator(kind, args.seed)
+        rows = []
+        for i in range(int(args.rows * share)):
+            ts = now - (i % 1440) * 60   # spread over 24 h
+            r = gen.record(ts=ts)
+            rows.append((ts, r["source"], r["title"], f"{SEED_URL}{kind}/{i}", "", kind))
+        execute_values(cur, """
+          INSERT INTO news_articles(published_ts, source, title, url, summary, kind)
+          VALUES %s
+        """, rows, template="(to_timestamp(%s), %s, %s, %s, %s, %s)", page_size=1000)
+    cur.execute("ANALYZE news_articles")
+    log(f"{args.rows} lignes injectées")
+
+    ticks = []
+    for _ in range(args.ticks):
+        t0 = time.perf_counter()
+        agg.tick(cur)
+        ticks.append(time.perf_counter() - t0)
+    phases = {
+        ph: round((REGISTRY.get_sample_value("trends_aggregator_phase_seconds_sum", {"phase": ph}) or 0)
+                  / args.ticks, 3)
+        for ph in ("query", "tokenize", "write")
+    }
+    if not args.keep:
+        cur.execute("DELETE FROM news_articles WHERE url LIKE %s", (SEED_URL + "%",))
+    return {
+        "stage": "aggregator",
+        "rows": args.rows,
+        "tick_s": latency_stats(ticks),
+        "phase_mean_s": phases,
+        "rows_per_s": round(args.rows / (sum(ticks) / len(ticks)), 1),
+        "memory_mb": {"harness": self_memory()},
+    }
+
+
+def run_api(args) -> dict:
+    import asyncio
+    import aiohttp
+
+    paths = ["/trends?kind=continu&window=60", "/trends?kind=une&window=1440",
+             "/articles/latest", "/articles/latest?kind=une", "/wiki/spikes"]
+    lat, codes = [], {}
+
+    async def client(session, i, deadline, etags):
+        while time.monotonic() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            # a third of the clients revalidate with If-None-Match, like a polling widget
+            hdrs = {"Accept-Encoding": "gzip"}
+            if i % 3 == 0 and path in etags:
+                hdrs["If-None-Match"] = etags[path]
+            t0 = time.perf_counter()
+            async with session.get(API_URL + path, headers=hdrs) as r:
+                await r.read()
+                if "ETag" in r.headers:
+                    etags[path] = r.headers["ETag"]
+            lat.append(time.perf_counter() - t0)
+            codes[r.status] = codes.get(r.status, 0) + 1
+
+    async def go():
+        conn = aiohttp.TCPConnector(limit=args.concurrency)
+        async with aiohttp.ClientSession(connector=conn) as session:
+            before = await (await session.get(API_URL + "/health")).json()
+            deadline = time.monotonic() + args.duration
+            t0 = time.monotonic()
+            await asyncio.gather(*(client(session, i, deadline, {}) for i in range(args.concurrency)))
+            elapsed = time.monotonic() - t0
+            after = await (await session.get(API_URL + "/health")).json()
+        return elapsed, before, after
+
+    elapsed, before, after = asyncio.run(go())
+    return {
+        "stage": "api",
+        "duration_s": round(elapsed, 1),
+        "concurrency": args.concurrency,
+        "requests": len(lat),
+        "req_per_s": round(len(lat) / elapsed, 1),
+        "latency_s": latency_stats(lat),
+        "status": codes,
+        "db_refreshes_during_run": after["db_refreshes"] - before["db_refreshes"],
+    }
+
+
+STAGES = {"e2e": run_e2e, "producer": run_producer, "db_writer": run_db_writer,
+          "aggregator": run_aggregator, "api": run_api}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmarks du pipeline trends")
+    ap.add_argument("stage", choices=list(STAGES))
+    ap.add_argument("--duration", type=float, default=120, help="secondes de mesure")
+    ap.add_argument("--warmup", type=float, default=30)
+    ap.add_argument("--settle", type=float, default=90, help="attente max des dernières sondes / du drain")
+    ap.add_argument("--rate-une", type=float, default=5.0)
+    ap.add_argument("--rate-continu", type=float, default=20.0)
+    ap.add_argument("--rate-wiki", type=float, default=30.0)
+    ap.add_argument("--rate", type=float, default=1000.0, help="records/s envoyés (db_writer)")
+    ap.add_argument("--probes", type=int, default=10)
+    ap.add_argument("--probe-copies", type=int, default=3, help="copies minimales par sonde (relevées selon le seuil du top 50)")
+    ap.add_argument("--rows", type=int, default=100000, help="lignes injectées (aggregator)")
+    ap.add_argument("--ticks", type=int, default=5)
+    ap.add_argument("--concurrency", type=int, default=64, help="clients simultanés (api)")
+    ap.add_argument("--keep", action="store_true", help="garder les lignes injectées")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="ajoute le rapport JSON à ce fichier")
+    args = ap.parse_args()
+
+    report = {"ts": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), **STAGES[args.stage](args)}
+    line = json.dumps(report, ensure_ascii=False)
+    print(line, flush=True)
+    if args.out:
+        with open(args.out, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    if report.get("failed"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
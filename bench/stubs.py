@@ -0,0 +1,180 @@
+"""Offline stand-ins for the RSS feeds and the Wikipedia action API.
+
+One threaded HTTP server answers every feed host: the producers reach it via
+``HTTP_PROXY``, so the request line carries the original URL
+(``GET http://lemonde.fr/bench/une.xml``) and the host/kind are read from it.
+``/w/api.php?list=recentchanges`` mimics what ``wiki_producer`` polls.
+
+A pump thread feeds the stores at the configured rates; ``inject`` lets the
+harness publish probe headlines and note when they became visible.
+
+    python -m bench.stubs --port 8080 --rate-continu 20 --rate-une 5 --rate-wiki 30
+"""
+import argparse
+import collections
+import json
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from xml.sax.saxutils import escape
+
+from bench.generate import HeadlineGenerator, WikiEditGenerator
+
+FEED_DEPTH = 50      # items kept per (host, kind), like a real RSS feed
+WIKI_DEPTH = 20000   # recent changes kept for rccontinue paging
+
+
+class FeedStore:
+    def __init__(self, seed: int = 0):
+        self.gens = {k: HeadlineGenerator(k, seed) for k in ("une", "continu")}
+        self.items = collections.defaultdict(lambda: collections.deque(maxlen=FEED_DEPTH))
+        self.version = collections.Counter()
+        self.lock = threading.Lock()
+
+    def add(self, kind: str, title=None, source=None) -> dict:
+        rec = self.gens[kind].record(title=title, source=source)
+        with self.lock:
+            self.items[(rec["source"], kind)].appendleft(rec)
+            self.version[(rec["source"], kind)] += 1
+        return rec
+
+    def rss(self, host: str, kind: str):
+        with self.lock:
+            items = list(self.items.get((host, kind), ()))
+            version = self.version[(host, kind)]
+        body = ["<?xml version='1.0' encoding='utf-8'?>",
+                f"<rss version='2.0'><channel><title>{escape(host)}</title><link>https://{escape(host)}/</link>"]
+        for it in items:
+            body.append(
+                f"<item><title>{escape(it['title'])}</title><link>{escape(it['url'])}</link>"
+                f"<pubDate>{formatdate(it['published_ts'], usegmt=True)}</pubDate></item>"
+            )
+        body.append("</channel></rss>")
+        return "".join(body).encode("utf-8"), f'"{host}-{kind}-{version}"'
+
+
+class WikiStore:
+    def __init__(self, seed: int = 0):
+        self.gen = WikiEditGenerator(seed)
+        self.changes = collections.deque(maxlen=WIKI_DEPTH)
+        self.lock = threading.Lock()
+
+    def add(self) -> None:
+        ch = self.gen.change()
+        with self.lock:
+            self.changes.append(ch)
+
+    def query(self, rccontinue=None, limit: int = 50) -> dict:
+        after = int(rccontinue.split("|")[1]) if rccontinue else 0
+        with self.lock:
+            if not after and self.changes:
+                after = self.changes[-1]["rcid"] - limit   # rcstart ≈ "a minute ago"
+            batch = [c for c in self.changes if c["rcid"] > after][:limit]
+        last = batch[-1]["rcid"] if batch else after
+        token = f"{time.strftime('%Y%m%d%H%M%S', time.gmtime())}|{last}"
+        return {"continue": {"rccontinue": token}, "query": {"recentchanges": batch}}
+
+
+class StubServer:
+    """Feed + wiki stores, the HTTP server and the pump thread."""
+
+    def __init__(self, port=8080, rates=None, seed=0):
+        self.rates = {"une": 5.0, "continu": 20.0, "wiki": 30.0, **(rates or {})}
+        self.feeds = FeedStore(seed)
+        self.wiki = WikiStore(seed)
+        self.requests = collections.Counter()
+        self._stop = threading.Event()
+        self.httpd = ThreadingHTTPServer(("0.0.0.0", port), self._handler())
+        self.httpd.daemon_threads = True
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                u = urlsplit(self.path)
+                host = (u.netloc or self.headers.get("Host", "")).split(":")[0].replace("www.", "")
+                if u.path == "/w/api.php":
+                    q = parse_qs(u.query)
+                    data = stub.wiki.query(q.get("rccontinue", [None])[0], int(q.get("rclimit", ["50"])[0]))
+                    stub.requests["wiki"] += 1
+                    return self._send(200, json.dumps(data).encode("utf-8"), "application/json")
+                kind = u.path.rsplit("/", 1)[-1].removesuffix(".xml")
+                if kind not in ("une", "continu"):
+                    return self._send(404, b"not found", "text/plain")
+                body, etag = stub.feeds.rss(host, kind)
+                stub.requests[kind] += 1
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, b"", None, etag)
+                self._send(200, body, "application/rss+xml", etag)
+
+            def _send(self, code, body, ctype, etag=None):
+                self.send_response(code)
+                if ctype:
+                    self.send_header("Content-Type", ctype)
+                if etag:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def pump(self) -> None:
+        """Add items at the configured rates (fractional credit carried over)."""
+        credit = collections.Counter()
+        last = time.monotonic()
+        while not self._stop.is_set():
+            time.sleep(0.05)
+            now = time.monotonic()
+            dt, last = now - last, now
+            for kind, rate in self.rates.items():
+                credit[kind] += rate * dt
+                n = int(credit[kind])
+                credit[kind] -= n
+                for _ in range(n):
+                    if kind == "wiki":
+                        self.wiki.add()
+                    else:
+                        self.feeds.add(kind)
+
+    def inject(self, kind: str, titles) -> float:
+        """Publish ``titles`` round-robin over the sources; return the wall time."""
+        sources = self.feeds.gens[kind].sources
+        for i, title in enumerate(titles):
+            self.feeds.add(kind, title=title, source=sources[i % len(sources)])
+        return time.time()
+
+    def start(self) -> "StubServer":
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        threading.Thread(target=self.pump, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.httpd.shutdown()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Stub RSS / Wikipedia pour les benchmarks")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--rate-une", type=float, default=5.0, help="articles/s")
+    ap.add_argument("--rate-continu", type=float, default=20.0, help="articles/s")
+    ap.add_argument("--rate-wiki", type=float, default=30.0, help="modifications/s")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    StubServer(args.port, {"une": args.rate_une, "continu": args.rate_continu, "wiki": args.rate_wiki},
+               args.seed).start()
+    print(f"stub sur :{args.port}", flush=True)
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Code partagé entre producers et consumers (copié dans chaque image)."""
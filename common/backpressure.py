@@ -0,0 +1,102 @@
+"""Flow control between ``db_writer`` and the producers.
+
+``db_writer`` publishes its state (consumer lag, flush and commit latency,
+batch size) every ``STATUS_SEC`` on the ``STATUS_TOPIC`` Kafka topic. Each
+producer follows that topic from a daemon thread and derives a pressure level
+in [0, 1]::
+
+    level = max(lag / LAG_HIGH, flush_s / FLUSH_HIGH, inflight / INFLIGHT_HIGH)
+
+``inflight`` counts the producer's own sends not yet acknowledged: it rises
+before ``send`` would block on a full buffer. The scheduler stretches every
+poll interval by up to ``STRETCH_MAX`` and defers low-priority sources
+(GDELT, Mediastack) while ``level >= SHED_LEVEL``. A status older than
+``STALE_SEC`` is ignored: Kafka keeps buffering if ``db_writer`` is down.
+"""
+import json
+import os
+import threading
+import time
+
+from common.metrics import PRODUCER_INFLIGHT, PRODUCER_PRESSURE
+
+BOOT = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:29092")
+STATUS_TOPIC = os.getenv("STATUS_TOPIC", "pipeline_status")
+STATUS_SEC = float(os.getenv("STATUS_SEC", "5"))
+STALE_SEC = float(os.getenv("STATUS_STALE_SEC", "30"))
+LAG_HIGH = int(os.getenv("LAG_HIGH", "20000"))             # messages
+FLUSH_HIGH = float(os.getenv("FLUSH_HIGH_SEC", "2"))       # secondes par flush
+INFLIGHT_HIGH = int(os.getenv("INFLIGHT_HIGH", "5000"))    # envois non acquittés
+STRETCH_MAX = float(os.getenv("STRETCH_MAX", "4"))
+SHED_LEVEL = float(os.getenv("SHED_LEVEL", "0.7"))
+
+
+class StatusPublisher:
+    """db_writer side: send the latest status at most every ``STATUS_SEC``."""
+
+    def __init__(self, producer):
+        self.producer = producer
+        self.sent_at = 0.0
+
+    def maybe_publish(self, **status) -> None:
+        now = time.time()
+        if now - self.sent_at < STATUS_SEC:
+            return
+        self.sent_at = now
+        self.producer.send(STATUS_TOPIC, {"ts": now, **status})
+
+
+class Pressure:
+    """Producer side: follows ``STATUS_TOPIC`` and counts in-flight sends."""
+
+    def __init__(self, log=print):
+        self.log = log
+        self.status = None
+        self.received = 0.0
+        self.inflight = 0
+        self.lock = threading.Lock()
+
+    def start(self) -> "Pressure":
+        threading.Thread(target=self.follow, name="pressure", daemon=True).start()
+        return self
+
+    def follow(self) -> None:
+        from kafka import KafkaConsumer
+
+        while True:
+            try:
+                consumer = KafkaConsumer(STATUS_TOPIC, bootstrap_servers=BOOT, auto_offset_reset="latest",
+                                         enable_auto_commit=False,
+                                         value_deserializer=lambda v: json.loads(v.decode("utf-8")))
+                for msg in consumer:
+                    self.status, self.received = msg.value, time.time()
+            except Exception as exc:
+                self.log(f"statut db_writer indisponible ({exc}) → nouvel essai dans 5s")
+                time.sleep(5)
+
+    def track(self, future) -> None:
+        """Count a ``KafkaProducer.send`` future until it is acked or failed."""
+        with self.lock:
+            self.inflight += 1
+        future.add_both(self._done)
+
+    def _done(self, _result) -> None:
+        with self.lock:
+            self.inflight -= 1
+
+    def level(self) -> float:
+        PRODUCER_INFLIGHT.set(self.inflight)
+        parts = [self.inflight / INFLIGHT_HIGH]
+        st = self.status
+        if st and time.time() - self.received < STALE_SEC:
+            parts += [st.get("lag", 0) / LAG_HIGH, st.get("flush_s", 0) / FLUSH_HIGH]
+        level = min(max(parts), 1.0)
+        PRODUCER_PRESSURE.set(level)
+        return level
+
+    def stretch(self) -> float:
+        """Poll-interval multiplier, 1 (idle) to ``STRETCH_MAX`` (saturated)."""
+        return 1.0 + self.level() * (STRETCH_MAX - 1.0)
+
+    def shed(self, source) -> bool:
+        return source.priority == "low" and self.level() >= SHED_LEVEL
@@ -0,0 +1,48 @@
+"""URL canonicalisation and title hashing (stdlib only).
+
+Used by the producers (``common/sources.py``) to clean every record, by
+``db_writer`` for records that arrive without the keys, and by
+``db/dedup_news.py`` to backfill existing rows: one implementation, so the
+unique index sees the same key whoever computed it.
+"""
+import hashlib
+import re
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit
+
+# utm_* (Google), xtor / at_* (AT Internet, très courant sur la presse FR), clics pub
+TRACKING = re.compile(r"^(utm_\w+|xtor|at_\w+|fbclid|gclid|dclid|mc_cid|mc_eid|ns_\w+)$", re.I)
+_NOT_WORD = re.compile(r"[\W_]+")
+
+
+@lru_cache(maxsize=16384)
+def canonical_url(url: str) -> str:
+    """Scheme/host in lower case, no fragment, no tracking parameters (still clickable)."""
+    url = (url or "").strip()
+    if not url:
+        return ""
+    u = urlsplit(url)
+    query = u.query
+    if query:
+        query = "&".join(p for p in query.split("&") if p and not TRACKING.match(p.split("=", 1)[0]))
+    return urlunsplit((u.scheme.lower(), u.netloc.lower(), u.path or "/", query, ""))
+
+
+@lru_cache(maxsize=16384)
+def url_key(url: str) -> str:
+    """Dedup key: canonical URL without scheme, ``www.``, trailing slash; sorted query."""
+    u = urlsplit(canonical_url(url))
+    if not u.netloc:
+        return ""
+    host = u.netloc.removeprefix("www.")
+    path = u.path.rstrip("/") or "/"
+    query = "&".join(sorted(u.query.split("&"))) if u.query else ""
+    return f"{host}{path}?{query}" if query else f"{host}{path}"
+
+
+def title_hash(title: str):
+    """Signed 64-bit hash of the title, case and punctuation folded (``None`` if empty)."""
+    norm = _NOT_WORD.sub(" ", (title or "").lower()).strip()
+    if not norm:
+        return None
+    return int.from_bytes(hashlib.blake2b(norm.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
@@ -0,0 +1,84 @@
+"""Prometheus metrics shared by the producers and consumers.
+
+Every service imports the metric objects it needs from here and calls
+``start_metrics_server`` once at startup; the ``/metrics`` endpoint is then
+served from a daemon thread. Updating a metric is a lock + an addition, so the
+hot paths (per-record sends, per-flush writes) stay cheap.
+"""
+import os
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "8000"))
+
+# Latency buckets (seconds) covering fast DB writes up to slow HTTP feeds.
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+# --- Producers -------------------------------------------------------------
+FEED_FETCH_SECONDS = Histogram(
+    "trends_feed_fetch_seconds", "Durée de récupération d'un flux",
+    ["feed", "kind"], buckets=_BUCKETS,
+)
+FEED_FETCH_TOTAL = Counter(
+    "trends_feed_fetch_total", "Récupérations de flux par statut (ok, not_modified, bozo, error)",
+    ["feed", "kind", "status"],
+)
+RECORDS_SENT = Counter(
+    "trends_records_sent_total", "Records envoyés à Kafka", ["topic"],
+)
+RECORDS_ACKED = Counter(
+    "trends_records_acked_total", "Records acquittés par Kafka", ["topic"],
+)
+RECORDS_FAILED = Counter(
+    "trends_records_failed_total", "Records refusés par Kafka", ["topic"],
+)
+PRODUCER_PRESSURE = Gauge(
+    "trends_producer_pressure", "Niveau de pression aval (0 = libre, 1 = saturé)",
+)
+PRODUCER_INFLIGHT = Gauge(
+    "trends_producer_inflight", "Envois Kafka non encore acquittés",
+)
+SOURCES_DEFERRED = Counter(
+    "trends_sources_deferred_total", "Passages de source reportés sous pression", ["source"],
+)
+
+# --- db_writer -------------------------------------------------------------
+DB_BATCH_SIZE = Histogram(
+    "trends_db_batch_size", "Nombre de records par flush",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+)
+DB_FLUSH_SECONDS = Histogram(
+    "trends_db_flush_seconds", "Durée d'un flush (écriture + commit)", buckets=_BUCKETS,
+)
+DB_WRITE_ERRORS = Counter(
+    "trends_db_write_errors_total", "Erreurs d'écriture par topic", ["topic"],
+)
+CONSUMER_LAG = Gauge(
+    "trends_consumer_lag", "Retard du consumer (messages) par partition",
+    ["topic", "partition"],
+)
+DB_BATCH_TARGET = Gauge(
+    "trends_db_batch_target", "Taille de lot visée (ajustée à la latence de commit)",
+)
+
+# --- spike_aggregator ------------------------------------------------------
+AGG_PHASE_SECONDS = Histogram(
+    "trends_aggregator_phase_seconds", "Durée d'une phase du tick (query, tokenize, write)",
+    ["phase"], buckets=_BUCKETS,
+)
+AGG_TICK_SECONDS = Histogram(
+    "trends_aggregator_tick_seconds", "Durée totale d'un tick", buckets=_BUCKETS,
+)
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> None:
+    """Expose ``/metrics`` on ``port`` (0 disables the endpoint)."""
+    if port:
+        start_http_server(port)
+
+
+def track_send(future, topic: str) -> None:
+    """Count a ``KafkaProducer.send`` future as sent, then acked or failed."""
+    RECORDS_SENT.labels(topic).inc()
+    future.add_callback(lambda _md: RECORDS_ACKED.labels(topic).inc())
+    future.add_errback(lambda _exc: RECORDS_FAILED.labels(topic).inc())
@@ -0,0 +1,164 @@
+"""Opt-in profiling for the consumers (spike_aggregator ticks, db_writer flushes).
+
+Off by default. Enable with ``PROFILE=1`` or at runtime with ``kill -USR1 <pid>``
+(toggles). While enabled:
+
+- each ``tick`` records the duration of its ``phase`` blocks and of every SQL
+  statement run through ``cursor_factory()`` cursors;
+- a tick slower than ``SLOW_TICK_SEC`` is logged with its phase breakdown and
+  the ``EXPLAIN (ANALYZE, BUFFERS)`` plan of its slowest statements (run inside
+  a rolled-back transaction, so writes are not applied twice);
+- cProfile runs on the main thread; ``kill -USR2 <pid>`` dumps it to
+  ``PROFILE_DIR`` as a pstats file (snakeviz, ``python -m pstats``...).
+
+Phase durations are also observed on the given Prometheus histogram, profiling
+or not, so callers only need one ``with`` per phase.
+"""
+import cProfile
+import heapq
+import os
+import re
+import signal
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import psycopg2.extensions
+
+PROFILE = os.getenv("PROFILE", "0") == "1"
+SLOW_TICK_SEC = float(os.getenv("SLOW_TICK_SEC", "5"))
+SLOW_SQL_TOP = int(os.getenv("SLOW_SQL_TOP", "3"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/profiles")
+# BEGIN / COMMIT / NOTIFY… ne s'EXPLAINent pas : hors du top des requêtes lentes
+EXPLAINABLE = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.I)
+
+
+def sql_text(conn, query) -> str:
+    """Statement as text; ``execute_values`` passes already-mogrified bytes."""
+    if isinstance(query, bytes):
+        return query.decode(psycopg2.extensions.encodings.get(conn.encoding, conn.encoding))
+    return str(query)
+
+
+class Profiler:
+    def __init__(self, service: str, phase_histogram=None):
+        self.service = service
+        self.phase_histogram = phase_histogram
+        self.enabled = False
+        self._cprof = cProfile.Profile()
+        self._phases = defaultdict(float)
+        self._slow_sql = []   # min-heap of (duration, seq, query, vars)
+        self._seq = 0
+        if PROFILE:
+            self.enable()
+
+    def log(self, msg: str) -> None:
+        print(f"{datetime.now(timezone.utc).isoformat()} [{self.service}] {msg}", flush=True)
+
+    # --- on/off ------------------------------------------------------------
+    def enable(self) -> None:
+        self.enabled = True
+        self._cprof.enable()
+        self.log("profiling activé")
+
+    def disable(self) -> None:
+        self.enabled = False
+        self._cprof.disable()
+        self.log("profiling désactivé")
+
+    def install_signals(self) -> None:
+        """SIGUSR1 toggles profiling, SIGUSR2 dumps the cProfile stats."""
+        signal.signal(signal.SIGUSR1, lambda *_: self.disable() if self.enabled else self.enable())
+        signal.signal(signal.SIGUSR2, lambda *_: self.dump())
+
+    def dump(self) -> str:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{self.service}-{int(time.time())}.prof")
+        self._cprof.dump_stats(path)   # stops the profiler as a side effect
+        if self.enabled:
+            self._cprof.enable()
+        self.log(f"profil écrit dans {path}")
+        return path
+
+    # --- timers ------------------------------------------------------------
+    @contextmanager
+    def phase(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - t0
+            if self.phase_histogram is not None:
+                self.phase_histogram.labels(name).observe(dt)
+            if self.enabled:
+                self._phases[name] += dt
+
+    @contextmanager
+    def tick(self, conn, histogram=None):
+        """Time one unit of work; report it if profiling and slower than the threshold."""
+        self._phases.clear()
+        self._slow_sql.clear()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - t0
+            if histogram is not None:
+                histogram.observe(dt)
+            if self.enabled and dt > SLOW_TICK_SEC:
+                self.report(conn, dt)
+
+    def record_sql(self, dt: float, query: str, vars) -> None:
+        if not EXPLAINABLE.match(query):
+            return
+        self._seq += 1
+        item = (dt, self._seq, query, vars)
+        if len(self._slow_sql) < SLOW_SQL_TOP:
+            heapq.heappush(self._slow_sql, item)
+        elif dt > self._slow_sql[0][0]:
+            heapq.heapreplace(self._slow_sql, item)
+
+    def cursor_factory(self):
+        """psycopg2 cursor class timing ``execute`` while profiling is on."""
+        prof = self
+
+        class TracingCursor(psycopg2.extensions.cursor):
+            def execute(self, query, vars=None):
+                if not prof.enabled:
+                    return super().execute(query, vars)
+                t0 = time.perf_counter()
+                try:
+                    return super().execute(query, vars)
+                finally:
+                    prof.record_sql(time.perf_counter() - t0, sql_text(self.connection, query), vars)
+
+        return TracingCursor
+
+    # --- report ------------------------------------------------------------
+    def report(self, conn, dt: float) -> None:
+        breakdown = ", ".join(f"{k}={v:.3f}s" for k, v in sorted(self._phases.items(), key=lambda kv: -kv[1]))
+        self.log(f"tick lent {dt:.3f}s (> {SLOW_TICK_SEC}s) : {breakdown}")
+        for sql_dt, _, query, vars in sorted(self._slow_sql, reverse=True):
+            self.log(f"  SQL {sql_dt:.3f}s : {' '.join(query.split())[:300]}")
+            for line in explain_analyze(conn, query, vars):
+                self.log(f"    {line}")
+
+
+def explain_analyze(conn, query, vars=None) -> list:
+    """``EXPLAIN (ANALYZE, BUFFERS)`` of ``query`` inside a rolled-back transaction."""
+    plain = psycopg2.extensions.cursor
+    try:
+        with conn.cursor(cursor_factory=plain) as cur:
+            if conn.autocommit:
+                cur.execute("BEGIN")
+            try:
+                cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql_text(conn, query), vars)
+                return [r[0] for r in cur.fetchall()]
+            finally:
+                if conn.autocommit:
+                    cur.execute("ROLLBACK")
+                else:
+                    conn.rollback()
+    except Exception as exc:
+        return [f"EXPLAIN impossible : {exc}"]
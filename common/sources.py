@@ -0,0 +1,430 @@
+"""Source plugins for the producers: registry, shared normalisation, scheduler.
+
+A source implements ``entries(since)`` (raw dicts); ``Source.fetch(since)``
+returns them normalised in one pass over the batch (canonical URL and dedup
+keys, epoch timestamp, truncated summary) and minus what the source already
+emitted.
+Sources are built from specs, e.g. in the JSON list pointed to by
+``SOURCES_FILE``::
+
+    [{"type": "gdelt", "kind": "une", "interval": 120, "query": "sourceLanguage:French", "maxrecords": 250},
+     {"type": "mediastack", "kind": "une", "interval": 900, "key": "...", "tenants": ["fr", "be"]},
+     {"type": "rss", "url": "https://www.lemonde.fr/rss/une.xml", "kind": "une"},
+     {"type": "monpaquet.flux:MaSource", "kind": "continu"}]
+
+``type`` is a registered name or a ``module:Class`` path. ``Scheduler`` runs
+each source on its own interval in a shared thread pool, with a rate limit
+and exponential backoff per source: a slow or failing source never delays
+the others.
+"""
+import calendar
+import heapq
+import importlib
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.canon import canonical_url, title_hash, url_key
+from common.metrics import FEED_FETCH_SECONDS, FEED_FETCH_TOTAL, SOURCES_DEFERRED
+
+SOURCES_FILE = os.getenv("SOURCES_FILE", "")
+USER_AGENT = os.getenv("USER_AGENT", "TrendsRealtimeBot/1.0 (+github.com/yominax/trends-realtime; contact: you@example.com)")
+HTTP_POOL = int(os.getenv("HTTP_POOL", os.getenv("MAX_WORKERS", "12")))
+SUMMARY_MAX = 600
+SEEN_MAX = 5000
+BACKOFF_MAX = 900
+
+# Une seule session (pool keep-alive) pour toutes les sources du process
+HTTP = requests.Session()
+HTTP.headers["User-Agent"] = USER_AGENT
+HTTP.mount("http://", HTTPAdapter(pool_connections=64, pool_maxsize=HTTP_POOL))
+HTTP.mount("https://", HTTPAdapter(pool_connections=64, pool_maxsize=HTTP_POOL))
+
+RSS_ACCEPT = "application/rss+xml, application/xml;q=0.9, text/xml;q=0.8, */*;q=0.7"
+
+
+# --- normalisation -----------------------------------------------------------
+
+def host(url: str) -> str:
+    return urlsplit(url).netloc.lower().replace("www.", "")
+
+
+def parse_ts(value, now: int) -> int:
+    """Epoch seconds from whatever the APIs send; ``now`` when missing or unreadable."""
+    if not value:
+        return now
+    try:
+        if isinstance(value, (int, float)):
+            return int(value / 1000 if value > 1e12 else value)
+        if isinstance(value, (tuple, time.struct_time)):   # feedparser *_parsed
+            return calendar.timegm(tuple(value[:6]) + (0, 0, 0))
+        v = value.strip()
+        compact = v.replace("T", "").replace("Z", "")
+        if compact.isdigit() and len(compact) == 14:         # GDELT : 20240131T154500Z
+            return calendar.timegm(time.strptime(compact, "%Y%m%d%H%M%S"))
+        if v[:4].isdigit():                                   # ISO 8601
+            d = datetime.fromisoformat(v.replace("Z", "+00:00"))
+        else:                                                 # RFC 822 (RSS)
+            d = parsedate_to_datetime(v)
+        if d.tzinfo is None:
+            d = d.replace(tzinfo=timezone.utc)
+        return int(d.timestamp())
+    except (ValueError, TypeError, OverflowError):
+        return now
+
+
+class Seen:
+    """Bounded set of keys already emitted by a source (oldest evicted first)."""
+
+    def __init__(self, maxlen: int = SEEN_MAX):
+        self.keys = set()
+        self.order = deque()
+        self.maxlen = maxlen
+
+    def add(self, key) -> bool:
+        """True if ``key`` is new."""
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        self.order.append(key)
+        if len(self.order) > self.maxlen:
+            self.keys.discard(self.order.popleft())
+        return True
+
+
+class RateLimit:
+    """At most ``rate`` requests per second, shared by every source of a group."""
+
+    _groups = {}
+    _groups_lock = threading.Lock()
+
+    def __init__(self, rate=None):
+        self.gap = 1.0 / rate if rate else 0.0
+        self.next = 0.0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def group(cls, name: str, rate=None) -> "RateLimit":
+        with cls._groups_lock:
+            if name not in cls._groups:
+                cls._groups[name] = cls(rate)
+            return cls._groups[name]
+
+    def wait(self) -> None:
+        if not self.gap:
+            return
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next)
+            self.next = at + self.gap
+        if at > now:
+            time.sleep(at - now)
+
+
+# --- plugins -----------------------------------------------------------------
+
+class BadFeed(Exception):
+    """Unparseable or empty response (counted as ``bozo``)."""
+
+
+REGISTRY = {}
+
+
+def register(name: str):
+    def deco(cls):
+        cls.type = name
+        REGISTRY[name] = cls
+        return cls
+    return deco
+
+
+class Source:
+    """Base plugin: subclasses implement ``entries(since)``.
+
+    ``entries`` yields dicts with ``published`` (any format ``parse_ts``
+    reads), ``title``, ``url`` and optionally ``source`` / ``summary``; it
+    returns ``None`` when the upstream answered "not modified".
+    """
+
+    type = None
+
+    def __init__(self, name=None, kind="une", interval=60, rate=None, rate_group=None,
+                 timeout=20, tenants=None, summary_max=SUMMARY_MAX, priority="normal"):
+        self.name = name or self.type
+        self.kind = kind
+        self.priority = priority        # "low" : reportée sous pression (cf. common/backpressure.py)
+        self.interval = float(interval)
+        self.limit = RateLimit.group(rate_group or self.name, rate)
+        self.timeout = timeout
+        self.tenants = tenants          # None = tenants qui activent ce type
+        self.summary_max = summary_max
+        self.seen = Seen()
+        self.failures = 0
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.name} {self.kind}>"
+
+    def entries(self, since):
+        raise NotImplementedError
+
+    def get(self, url, **kw):
+        self.limit.wait()
+        r = HTTP.get(url, timeout=self.timeout, **kw)
+        r.raise_for_status()
+        return r
+
+    def fetch(self, since=None):
+        """Iterator of normalised records not yet emitted by this source."""
+        t0 = time.perf_counter()
+        status = "error"
+        try:
+            raw = self.entries(since)
+            status = "not_modified" if raw is None else "ok"
+            return iter(self.normalize(list(raw or ())))
+        except BadFeed:
+            status = "bozo"
+            raise
+        finally:
+            FEED_FETCH_SECONDS.labels(self.name, self.kind).observe(time.perf_counter() - t0)
+            FEED_FETCH_TOTAL.labels(self.name, self.kind, status).inc()
+
+    def normalize(self, batch):
+        # un seul passage par lot : une lecture d'horloge, URLs mises en cache
+        now = int(time.time())
+        out = []
+        for e in batch:
+            url = canonical_url(e.get("url") or "")
+            title = (e.get("title") or "").strip()
+            if not (url or title) or not self.seen.add((url, title)):
+                continue
+            out.append({
+                "published_ts": parse_ts(e.get("published"), now),
+                "source": e.get("source") or host(url),
+                "title": title,
+                "url": url,
+                "summary": (e.get("summary") or "")[:self.summary_max],
+                "url_canon": url_key(url),
+                "title_hash": title_hash(title),
+            })
+        return out
+
+
+@register("rss")
+class RssSource(Source):
+    """RSS/Atom feed, polled with conditional GET (ETag / Last-Modified)."""
+
+    def __init__(self, url, max_items=100, **kw):
+        kw.setdefault("name", host(url))
+        super().__init__(**kw)
+        self.url = url
+        self.max_items = max_items
+        self.validators = {}
+
+    def entries(self, since):
+        import feedparser   # seuls les producers RSS l'installent
+
+        hdrs = {"Accept": RSS_ACCEPT}
+        if self.validators.get("etag"): hdrs["If-None-Match"] = self.validators["etag"]
+        if self.validators.get("modified"): hdrs["If-Modified-Since"] = self.validators["modified"]
+        # suit les redirections proprement (évite les boucles 30x de feedparser)
+        r = self.get(self.url, headers=hdrs, allow_redirects=True)
+        if r.status_code == 304:
+            return None
+        self.validators = {"etag": r.headers.get("ETag"), "modified": r.headers.get("Last-Modified")}
+        # ne pas rejeter si le serveur renvoie text/html alors que c'est un RSS valide
+        d = feedparser.parse(r.content)
+        if d.bozo or not getattr(d, "entries", None):
+            raise BadFeed(f"bozo={getattr(d, 'bozo_exception', None)}")
+        return [{
+            "published": e.get("published_parsed") or e.get("updated_parsed"),
+            "source": self.name,
+            "title": e.get("title"),
+            "url": e.get("link"),
+            "summary": e.get("summary"),
+        } for e in d.entries[:self.max_items]]
+
+
+@register("gdelt")
+class GdeltSource(Source):
+    """GDELT DOC 2.0 article list."""
+
+    API = "https://api.gdeltproject.org/api/v2/doc/doc"
+
+    def __init__(self, query="sourceLanguage:French", maxrecords=250, **kw):
+        kw.setdefault("rate", 0.2)   # GDELT demande ≤ 1 requête / 5 s
+        kw.setdefault("priority", "low")
+        super().__init__(**kw)
+        self.query = query
+        self.max = maxrecords
+
+    def entries(self, since):
+        params = {"query": self.query, "mode": "ArtList", "format": "json",
+                  "maxrecords": self.max, "sort": "DateDesc"}
+        if since:
+            params["startdatetime"] = time.strftime("%Y%m%d%H%M%S", time.gmtime(since))
+        data = self.get(self.API, params=params).json()
+        return [{"published": a.get("seendate"), "title": a.get("title"), "url": a.get("url"),
+                 "summary": a.get("excerpt")} for a in data.get("articles", [])]
+
+
+@register("mediastack")
+class MediastackSource(Source):
+    """Mediastack news API (optional, needs an access key)."""
+
+    API = "http://api.mediastack.com/v1/news"
+
+    def __init__(self, key="", languages="fr", limit=50, **kw):
+        kw.setdefault("priority", "low")
+        super().__init__(**kw)
+        self.key = key or os.getenv("MEDIASTACK_KEY", "")
+        self.languages = languages
+        self.max = limit
+
+    def entries(self, since):
+        params = {"access_key": self.key, "languages": self.languages, "limit": self.max,
+                  "sort": "published_desc"}
+        data = self.get(self.API, params=params).json()
+        return [{"published": a.get("published_at"), "title": a.get("title"), "url": a.get("url"),
+                 "summary": a.get("description")} for a in data.get("data", [])]
+
+
+@register("wiki")
+class WikiSource(Source):
+    """Wikipedia recent changes of one domain, followed with ``rccontinue``."""
+
+    API = os.getenv("WIKI_API", "https://{domain}/w/api.php")
+
+    def __init__(self, domain="fr.wikipedia.org", limit=50, **kw):
+        kw.setdefault("name", domain)
+        kw.setdefault("kind", "wiki")
+        super().__init__(**kw)
+        self.domain = domain
+        self.max = limit
+        self.rccontinue = None
+
+    def entries(self, since):
+        params = {
+            "action": "query", "format": "json", "list": "recentchanges",
+            "rcprop": "title|user|comment|timestamp|sizes",
+            "rcnamespace": "0",
+            "rctype": "edit|new",
+            "rcshow": "!bot",
+            "rclimit": str(self.max),
+            "rcdir": "newer",
+            "origin": "*",
+        }
+        if self.rccontinue:
+            params["rccontinue"] = self.rccontinue
+        else:
+            params["rcstart"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(since or time.time() - 60))
+        data = self.get(self.API.format(domain=self.domain), params=params,
+                        headers={"Accept": "application/json"}).json()
+        self.rccontinue = data.get("continue", {}).get("rccontinue", self.rccontinue)
+        return data.get("query", {}).get("recentchanges", [])
+
+    def normalize(self, batch):
+        # les modifications sont déjà uniques (rccontinue) : pas de dédoublonnage
+        now = int(time.time())
+        return [{
+            "page": rc.get("title"),
+            "ts": parse_ts(rc.get("timestamp"), now),
+            "user": rc.get("user"), "comment": rc.get("comment"),
+            "delta": int((rc.get("newlen") or 0) - (rc.get("oldlen") or 0)),
+            "url": f"https://{self.domain}/wiki/{(rc.get('title') or '').replace(' ', '_')}",
+        } for rc in batch]
+
+
+def from_spec(spec: dict) -> Source:
+    spec = dict(spec)
+    typ = spec.pop("type")
+    cls = REGISTRY.get(typ)
+    if cls is None:
+        module, _, name = typ.partition(":")
+        cls = getattr(importlib.import_module(module), name)
+    return cls(**spec)
+
+
+def load_specs(default=()) -> list:
+    """Specs from ``SOURCES_FILE``, or ``default`` when no file is configured."""
+    if not SOURCES_FILE:
+        return list(default)
+    with open(SOURCES_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# --- scheduler ---------------------------------------------------------------
+
+class Scheduler:
+    """Run every source on its own clock in a shared pool.
+
+    ``emit(source, records)`` is called from the worker thread with each
+    non-empty batch. After a failure the next run is pushed back
+    exponentially (``interval * 2**failures``, capped, with jitter). With a
+    ``pressure`` (``common.backpressure.Pressure``), intervals are stretched
+    and low-priority sources deferred while downstream is saturated.
+    """
+
+    def __init__(self, sources, emit, workers=8, log=print, pressure=None):
+        self.sources = list(sources)
+        self.emit = emit
+        self.workers = workers
+        self.log = log
+        self.pressure = pressure
+        self.since = [None] * len(self.sources)
+        self.heap = []
+        self.cv = threading.Condition()
+
+    def delay(self, src) -> float:
+        interval = src.interval * (self.pressure.stretch() if self.pressure else 1.0)
+        if not src.failures:
+            return interval
+        return min(interval * 2 ** src.failures, BACKOFF_MAX) * random.uniform(0.8, 1.2)
+
+    def _run(self, i):
+        src = self.sources[i]
+        started = time.time()
+        try:
+            recs = list(src.fetch(self.since[i]))
+            if recs:
+                self.emit(src, recs)
+            src.failures = 0
+            self.since[i] = started
+        except Exception as ex:
+            src.failures += 1
+            self.log(f"{src.name} invalide: {ex}")
+        finally:
+            with self.cv:
+                heapq.heappush(self.heap, (time.monotonic() + self.delay(src), i))
+                self.cv.notify()
+
+    def run(self, stop=None):
+        stop = stop or threading.Event()
+        now = time.monotonic()
+        with self.cv:
+            for i, src in enumerate(self.sources):
+                # premiers passages étalés sur une seconde
+                heapq.heappush(self.heap, (now + i / max(len(self.sources), 1), i))
+        with ThreadPoolExecutor(max_workers=self.workers) as ex:
+            while not stop.is_set():
+                with self.cv:
+                    wait = self.heap[0][0] - time.monotonic() if self.heap else 1.0
+                    if wait > 0:
+                        self.cv.wait(min(wait, 1.0))
+                        continue
+                    _, i = heapq.heappop(self.heap)
+                    if self.pressure and self.pressure.shed(self.sources[i]):
+                        # reportée : `since` inchangé, le prochain passage couvre le trou
+                        SOURCES_DEFERRED.labels(self.sources[i].name).inc()
+                        heapq.heappush(self.heap, (time.monotonic() + self.delay(self.sources[i]), i))
+                        continue
+                ex.submit(self._run, i)
@@ -0,0 +1,44 @@
+"""Tenant configuration shared by producers and consumers.
+
+A tenant is a market (fr, be, ch, ca, en...) with its own feed lists, wiki
+language and Kafka topics. ``TENANTS_FILE`` points to a JSON list::
+
+    [{"tenant": "fr", "lang": "fr", "gdelt": true,
+      "news": {"topic": "news_fr", "feeds_une": "/app/feeds.txt", "feeds_cont": "/app/feeds_continu.txt"},
+      "wiki": {"topic": "wiki_rc"}},
+     {"tenant": "be", "lang": "fr", "news": {"topic": "news_fr", "feeds_une": "/app/feeds_be.txt"}}]
+
+Tenants may share a topic: every record carries its ``tenant`` field and is
+keyed by it. Without a file, each service falls back to the single tenant it
+builds from its historical env vars, so existing deployments are unchanged.
+"""
+import json
+import os
+
+TENANTS_FILE = os.getenv("TENANTS_FILE", "")
+DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "fr")
+
+
+def load_tenants(default: dict) -> list:
+    """Tenants from ``TENANTS_FILE``, or ``[default]`` when no file is configured."""
+    if not TENANTS_FILE:
+        return [default]
+    with open(TENANTS_FILE, encoding="utf-8") as f:
+        tenants = json.load(f)
+    for t in tenants:
+        t.setdefault("lang", "fr")
+    return tenants
+
+
+def topics(tenants: list, section: str) -> list:
+    """Distinct topics of one section (``news`` / ``wiki``), in config order."""
+    out = []
+    for t in tenants:
+        topic = (t.get(section) or {}).get("topic")
+        if topic and topic not in out:
+            out.append(topic)
+    return out
+
+
+def tenant_of(rec: dict) -> str:
+    return rec.get("tenant") or DEFAULT_TENANT
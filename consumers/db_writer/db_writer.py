@@ -4,14 +4,30 @@ import time
 from typing import Iterable
 
 import psycopg2
-from kafka import KafkaConsumer
+from kafka import KafkaConsumer, KafkaProducer
 from kafka.errors import NoBrokersAvailable
 
+from common.backpressure import StatusPublisher
+from common.canon import title_hash, url_key
+from common.metrics import (
+    CONSUMER_LAG,
+    DB_BATCH_SIZE,
+    DB_BATCH_TARGET,
+    DB_FLUSH_SECONDS,
+    DB_WRITE_ERRORS,
+    start_metrics_server,
+)
+from common.profiling import Profiler
+from common.tenants import DEFAULT_TENANT, load_tenants, tenant_of, topics
+
 # --- Configuration ---------------------------------------------------------
 BOOT = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:29092")
 TOPIC_NEWS = os.getenv("TOPIC_NEWS", "news_fr")
 TOPIC_WIKI = os.getenv("TOPIC_WIKI", "wiki_rc")
 TOPIC_HN = os.getenv("TOPIC_HN", "hn_posts")
+# consumer group : offsets repris au redémarrage, rembobinables
+# (consumers/spike_aggregator/backfill.py reset-group). Vide = relit tout le topic.
+GROUP = os.getenv("GROUP_ID") or None
 
 DBH = os.getenv("DB_HOST", "postgres")
 DBN = os.getenv("DB_NAME", "trends")
@@ -19,6 +35,16 @@ DBU = os.getenv("DB_USER", "trends")
 DBP = os.getenv("DB_PASS", "trends")
 DBPORT = int(os.getenv("DB_PORT", "5432"))
 
+BATCH_MIN = int(os.getenv("BATCH_MIN", "50"))     # records per flush, adaptive
+BATCH_MAX = int(os.getenv("BATCH_MAX", "2000"))   # between these bounds
+FLUSH_TARGET_SEC = float(os.getenv("FLUSH_TARGET_SEC", "1.0"))
+POLL_MS = int(os.getenv("POLL_MS", "1000"))       # max wait for a batch
+HOT_N = int(os.getenv("HOT_N", "50"))            # rows kept per (tenant, kind) in *_latest
+HOT_MARGIN_SEC = int(os.getenv("HOT_MARGIN_SEC", "30"))   # > longest writer transaction
+
+PROF = Profiler("db-writer")
+TracingCursor = PROF.cursor_factory()
+
 # --- Helpers ---------------------------------------------------------------
 
 def log(msg: str) -> None:
@@ -49,6 +75,7 @@ def kafka_consumer(topics: Iterable[str]):
             return KafkaConsumer(
                 *topics,
                 bootstrap_servers=BOOT,
+                group_id=GROUP,
                 value_deserializer=lambda v: json.loads(v.decode("utf-8")),
                 auto_offset_reset="earliest",
                 enable_auto_commit=True,
@@ -61,35 +88,46 @@ def kafka_consumer(topics: Iterable[str]):
 # --- Write helpers ---------------------------------------------------------
 
 def write_news(cur, rec: dict):
+    # url_canon / title_hash viennent des producers ; recalculés pour les anciens messages
+    url = rec.get("url")
+    title = rec.get("title")
     cur.execute(
         """
-
-        INSERT INTO news_articles(published_ts, source, title, url, summary, kind)
-        VALUES (to_timestamp(%s), %s, %s, %s, %s, %s)
-
-
-
+        INSERT INTO news_articles(published_ts, source, title, url, summary, kind, tenant, url_canon, title_hash)
+        SELECT to_timestamp(%(ts)s), %(source)s, %(title)s, %(url)s, %(summary)s, %(kind)s, %(tenant)s,
+               %(url_canon)s, %(title_hash)s
+        WHERE NOT EXISTS (
+            -- même titre, même source, sous une autre URL (AMP, mise à jour…)
+            SELECT 1 FROM news_articles
+            WHERE title_hash = %(title_hash)s AND source = %(source)s
+              AND tenant = %(tenant)s AND kind = %(kind)s
+              AND published_ts > to_timestamp(%(ts)s) - interval '2 days'
+        ) AND NOT EXISTS (
+            -- même URL canonique, y compris avant news_articles_canon_uniq (db/dedup_news.py)
+            SELECT 1 FROM news_articles
+            WHERE tenant = %(tenant)s AND kind = %(kind)s AND url_canon = %(url_canon)s
+        )
+        ON CONFLICT DO NOTHING
         """,
-        (
-            rec.get("published_ts"),
-            rec.get("source"),
-            rec.get("title"),
-            rec.get("url"),
-            rec.get("summary"),
-
-
-            rec.get("kind", "continu"),
-
-
-        ),
+        {
+            "ts": rec.get("published_ts"),
+            "source": rec.get("source"),
+            "title": title,
+            "url": url,
+            "summary": rec.get("summary"),
+            "kind": rec.get("kind", "continu"),
+            "tenant": tenant_of(rec),
+            "url_canon": rec.get("url_canon") or url_key(url) or None,
+            "title_hash": rec.get("title_hash") or title_hash(title),
+        },
     )
 
 
 def write_wiki(cur, rec: dict):
     cur.execute(
         """
-        INSERT INTO wiki_rc(ts, page, user_name, comment, delta, url)
-        VALUES (to_timestamp(%s), %s, %s, %s, %s, %s)
+        INSERT INTO wiki_rc(ts, page, user_name, comment, delta, url, tenant)
+        VALUES (to_timestamp(%s), %s, %s, %s, %s, %s, %s)
         """,
         (
             rec.get("ts"),
@@ -98,6 +136,7 @@ def write_wiki(cur, rec: dict):
             rec.get("comment"),
             rec.get("delta"),
             rec.get("url"),
+            tenant_of(rec),
         ),
     )
 
@@ -142,25 +181,239 @@ def write_hn(cur, rec: dict):
 
 # --- Main loop -------------------------------------------------------------
 
-HANDLERS = {
-    TOPIC_NEWS: write_news,
-    TOPIC_WIKI: write_wiki,
-    TOPIC_HN: write_hn,
-}
+def build_handlers(tenants) -> dict:
+    """Topic -> writer, over the topics of every configured tenant."""
+    handlers = {TOPIC_HN: write_hn}
+    handlers.update({t: write_news for t in topics(tenants, "news")})
+    handlers.update({t: write_wiki for t in topics(tenants, "wiki")})
+    return handlers
+
+
+TENANTS = load_tenants({"tenant": DEFAULT_TENANT, "news": {"topic": TOPIC_NEWS}, "wiki": {"topic": TOPIC_WIKI}})
+HANDLERS = build_handlers(TENANTS)
+
+
+class HotStore:
+    """Latest ``HOT_N`` rows per (tenant, kind) in the UNLOGGED ``*_latest`` tables.
+
+    Each flush copies the rows ingested since the last ``ts_ingest`` seen
+    minus ``HOT_MARGIN_SEC`` and trims the small table back to ``HOT_N`` per
+    group, inside the batch transaction: readers see the hot store and the
+    big tables move together. The margin catches rows of other writers
+    (``app/ingest.py``, a replica) that commit late; ids do not follow commit
+    order. Rows already present or too old to rank are skipped, so the
+    overlap costs reads only.
+    """
+
+    COPY = {
+        "news": """
+            WITH fresh AS (
+              SELECT id, tenant, kind, published_ts, source, title, url, ts_ingest FROM news_articles
+              WHERE ts_ingest > %(last)s::timestamptz - %(margin)s * interval '1 second'
+            ), ins AS (
+              INSERT INTO news_latest
+              SELECT id, tenant, kind, published_ts, source, title, url FROM fresh f
+              WHERE NOT EXISTS (SELECT 1 FROM news_latest l WHERE l.id = f.id)
+                AND f.published_ts > COALESCE((
+                  SELECT l.published_ts FROM news_latest l WHERE l.tenant = f.tenant AND l.kind = f.kind
+                  ORDER BY l.published_ts DESC OFFSET %(n)s - 1 LIMIT 1), '-infinity')
+              ON CONFLICT (id) DO NOTHING
+              RETURNING 1
+            )
+            SELECT MAX(ts_ingest), (SELECT COUNT(*) FROM ins) FROM fresh
+        """,
+        "wiki": """
+            WITH fresh AS (
+              SELECT id, tenant, ts, page, delta, url, ts_ingest FROM wiki_rc
+              WHERE ts_ingest > %(last)s::timestamptz - %(margin)s * interval '1 second'
+            ), ins AS (
+              INSERT INTO wiki_latest
+              SELECT id, tenant, ts, page, delta, url FROM fresh f
+              WHERE NOT EXISTS (SELECT 1 FROM wiki_latest l WHERE l.id = f.id)
+                AND f.ts > COALESCE((
+                  SELECT l.ts FROM wiki_latest l WHERE l.tenant = f.tenant
+                  ORDER BY l.ts DESC OFFSET %(n)s - 1 LIMIT 1), '-infinity')
+              ON CONFLICT (id) DO NOTHING
+              RETURNING 1
+            )
+            SELECT MAX(ts_ingest), (SELECT COUNT(*) FROM ins) FROM fresh
+        """,
+    }
+    TRIM = {
+        "news": """
+            DELETE FROM news_latest WHERE id IN (
+              SELECT id FROM (
+                SELECT id, row_number() OVER (PARTITION BY tenant, kind ORDER BY published_ts DESC, id DESC) AS rn
+                FROM news_latest) t
+              WHERE rn > %s)
+        """,
+        "wiki": """
+            DELETE FROM wiki_latest WHERE id IN (
+              SELECT id FROM (
+                SELECT id, row_number() OVER (PARTITION BY tenant ORDER BY ts DESC, id DESC) AS rn
+                FROM wiki_latest) t
+              WHERE rn > %s)
+        """,
+    }
+
+    def __init__(self):
+        self.last = {"news": None, "wiki": None}   # MAX(ts_ingest) seen, DB clock
+        self.pending = dict(self.last)
+
+    def bootstrap(self, conn) -> None:
+        """Refill from the big tables (start-up, or after a crash emptied them)."""
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE news_latest, wiki_latest")
+            for t in TENANTS:
+                for kind in ("une", "continu"):
+                    cur.execute("""
+                      INSERT INTO news_latest
+                      SELECT id, tenant, kind, published_ts, source, title, url FROM news_articles
+                      WHERE tenant=%s AND kind=%s ORDER BY published_ts DESC LIMIT %s
+                    """, (t["tenant"], kind, HOT_N))
+                cur.execute("""
+                  INSERT INTO wiki_latest
+                  SELECT id, tenant, ts, page, delta, url FROM wiki_rc
+                  WHERE tenant=%s ORDER BY ts DESC LIMIT %s
+                """, (t["tenant"], HOT_N))
+            cur.execute("SELECT COALESCE(MAX(ts_ingest), NOW()) FROM news_articles")
+            self.last["news"] = cur.fetchone()[0]
+            cur.execute("SELECT COALESCE(MAX(ts_ingest), NOW()) FROM wiki_rc")
+            self.last["wiki"] = cur.fetchone()[0]
+        conn.commit()
+
+    def update(self, cur) -> None:
+        for table in ("news", "wiki"):
+            cur.execute(self.COPY[table], {"last": self.last[table], "margin": HOT_MARGIN_SEC, "n": HOT_N})
+            top, inserted = cur.fetchone()
+            self.pending[table] = max(top, self.last[table]) if top else self.last[table]
+            if inserted:
+                cur.execute(self.TRIM[table], (HOT_N,))
+
+    def committed(self) -> None:
+        self.last = dict(self.pending)
+
+
+HOT = HotStore()
+
+
+def write_one_by_one(conn, msgs):
+    """Fallback when a batch fails: isolate the bad records."""
+    with conn.cursor() as cur:
+        for msg in msgs:
+            try:
+                HANDLERS[msg.topic](cur, msg.value)
+                conn.commit()
+            except Exception as exc:
+                conn.rollback()
+                DB_WRITE_ERRORS.labels(msg.topic).inc()
+                log(f"Erreur {exc} pour topic {msg.topic}")
+
+
+def flush(conn, msgs):
+    """Write a polled batch in a single transaction.
+
+    Returns ``(rows, write_s, commit_s)`` for the batch sizer, ``None`` when
+    there was nothing to write or the batch fell back to one by one.
+    """
+    msgs = [m for m in msgs if m.topic in HANDLERS]
+    if not msgs:
+        return None
+    DB_BATCH_SIZE.observe(len(msgs))
+    with PROF.tick(conn, DB_FLUSH_SECONDS):
+        try:
+            t0 = time.perf_counter()
+            with conn.cursor(cursor_factory=TracingCursor) as cur:
+                with PROF.phase("write"):
+                    for msg in msgs:
+                        HANDLERS[msg.topic](cur, msg.value)
+                with PROF.phase("hot"):
+                    HOT.update(cur)
+            t1 = time.perf_counter()
+            with PROF.phase("commit"):
+                conn.commit()
+            HOT.committed()
+            return len(msgs), t1 - t0, time.perf_counter() - t1
+        except Exception:
+            conn.rollback()
+            with PROF.phase("fallback"):
+                write_one_by_one(conn, msgs)
+            return None
+
+
+def update_lag(consumer) -> int:
+    """Lag per partition from the fetcher's cached high-water marks (no broker call)."""
+    total = 0
+    for tp in consumer.assignment():
+        hw = consumer.highwater(tp)
+        if hw is None:
+            continue
+        lag = max(hw - consumer.position(tp), 0)
+        CONSUMER_LAG.labels(tp.topic, str(tp.partition)).set(lag)
+        total += lag
+    return total
+
+
+class BatchSizer:
+    """Batch size from the measured cost of a flush.
+
+    A flush costs about ``c + n*r`` (``c`` commit, ``r`` write time per
+    row). The target keeps the commit under a fifth of the flush (fsync
+    amortised) while a flush fits in ``FLUSH_TARGET_SEC`` when commits are
+    cheap: ``n = max(4c/r, (T - c)/r)``, smoothed and clamped to
+    [``BATCH_MIN``, ``BATCH_MAX``]. It only grows while Kafka fills the
+    batches: a half-empty poll says nothing about the write cost.
+    """
+
+    def __init__(self, start: int = 500, alpha: float = 0.3):
+        self.n = min(max(start, BATCH_MIN), BATCH_MAX)
+        self.alpha = alpha
+        DB_BATCH_TARGET.set(self.n)
+
+    def observe(self, rows: int, write_s: float, commit_s: float) -> None:
+        if not rows or write_s <= 0:
+            return
+        r = write_s / rows
+        want = max(4 * commit_s / r, (FLUSH_TARGET_SEC - commit_s) / r)
+        if rows < self.n:
+            want = min(want, self.n)
+        n = (1 - self.alpha) * self.n + self.alpha * want
+        self.n = int(min(max(n, BATCH_MIN), BATCH_MAX))
+        DB_BATCH_TARGET.set(self.n)
+
+
+def status_producer():
+    """Create the status producer with retry on broker availability."""
+    while True:
+        try:
+            return KafkaProducer(
+                bootstrap_servers=BOOT,
+                value_serializer=lambda v: json.dumps(v).encode("utf-8"),
+            )
+        except NoBrokersAvailable:
+            log("Kafka non disponible (statut) → nouvel essai dans 5s")
+            time.sleep(5)
 
 
 def main():
+    start_metrics_server()
+    PROF.install_signals()
     conn = connect_db()
-    cur = conn.cursor()
+    conn.autocommit = False
+    HOT.bootstrap(conn)
     consumer = kafka_consumer(HANDLERS.keys())
-    for msg in consumer:
-        handler = HANDLERS.get(msg.topic)
-        if not handler:
-            continue
-        try:
-            handler(cur, msg.value)
-        except Exception as exc:
-            log(f"Erreur {exc} pour topic {msg.topic}")
+    sizer = BatchSizer()
+    status = StatusPublisher(status_producer())
+    last = (0, 0.0, 0.0)   # dernier lot écrit : un poll vide ne dit rien de la base
+    while True:
+        polled = consumer.poll(timeout_ms=POLL_MS, max_records=sizer.n)
+        cost = flush(conn, [m for msgs in polled.values() for m in msgs])
+        if cost:
+            sizer.observe(*cost)
+            last = cost
+        # lu par les producers (common/backpressure.py)
+        status.maybe_publish(lag=update_lag(consumer), flush_s=round(last[1] + last[2], 3),
+                             commit_s=round(last[2], 3), batch=sizer.n)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,192 @@
+"""Replay a past time range through the aggregator, or rewind a consumer group.
+
+    python backfill.py spikes --from 2026-09-01 --to 2026-10-01 --job rescore-v2 --workers 4
+    python backfill.py reset-group --group db-writer --at 2026-09-01T00:00 --dry-run
+
+``spikes`` splits the range into (tenant, hour) chunks run by a process pool.
+Each chunk takes a snapshot every ``--step`` seconds with the functions of
+``spike_aggregator.py``, anchored at the snapshot time instead of NOW(), so
+a formula change is replayed exactly as the service would compute it. Then,
+in one transaction, it deletes the chunk's previous spikes, upserts the new
+ones and records the chunk in ``backfill_checkpoints``
+(``db/migrate_08_backfill.sql``). A re-run of the same ``--job`` skips
+recorded chunks; ``--force`` recomputes them. The hour containing ``--to``
+(now by default) stops at ``--to`` and is not recorded: the next run
+completes it.
+
+``reset-group`` moves a consumer group to the first offsets at or after a
+date, to re-ingest raw messages still in Kafka retention. The group's
+consumers must be stopped (the broker refuses the commit otherwise). Only the
+news topics are rewound by default: ``news_articles`` drops replayed articles,
+but ``wiki_rc`` has no natural key and a replayed edit would be counted twice.
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
+import spike_aggregator as agg
+from common.tenants import topics
+
+HOUR = timedelta(hours=1)
+CONN = None   # une connexion par processus du pool
+
+
+def log(msg: str) -> None:
+    print(f"[backfill] {msg}", flush=True)
+
+
+def parse_ts(value: str) -> datetime:
+    ts = datetime.fromisoformat(value)
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def hours(start: datetime, end: datetime):
+    h = start.astimezone(timezone.utc)
+    while h < end:
+        yield h
+        h += HOUR
+
+
+# ------------------------------------------------------------------ spikes
+
+def init_worker() -> None:
+    global CONN
+    CONN = agg.connect()
+    CONN.autocommit = False
+
+
+def run_chunk(job: str, tenant: str, news: bool, wiki: bool, chunk: datetime, step: int, until: datetime):
+    """Recompute one (tenant, hour) chunk up to ``until``; returns (rows written, seconds)."""
+    t0 = time.perf_counter()
+    end = min(chunk + HOUR, until)   # jamais de snapshot dans le futur
+    try:
+        with CONN.cursor() as cur:
+            if news:
+                cur.execute("""DELETE FROM spikes_entities WHERE tenant=%s AND kind IN ('news_continu','news_une')
+                               AND ts >= %s AND ts < %s""", (tenant, chunk, end))
+                cur.execute("DELETE FROM spikes_news WHERE tenant=%s AND ts >= %s AND ts < %s", (tenant, chunk, end))
+            if wiki:
+                cur.execute("DELETE FROM spikes_wiki WHERE tenant=%s AND ts >= %s AND ts < %s", (tenant, chunk, end))
+            for k in range(0, 3600, step):
+                at = chunk + timedelta(seconds=k)
+                if at >= end:
+                    break
+                if news:
+                    agg.news_spikes(cur, tenant, at)
+                if wiki:
+                    agg.wiki_spikes(cur, agg.WIKI_WINDOW, tenant, at)
+            cur.execute("""
+              SELECT (SELECT COUNT(*) FROM spikes_entities WHERE tenant=%(t)s AND ts >= %(a)s AND ts < %(b)s)
+                   + (SELECT COUNT(*) FROM spikes_news WHERE tenant=%(t)s AND ts >= %(a)s AND ts < %(b)s)
+                   + (SELECT COUNT(*) FROM spikes_wiki WHERE tenant=%(t)s AND ts >= %(a)s AND ts < %(b)s)
+            """, {"t": tenant, "a": chunk, "b": end})
+            rows = cur.fetchone()[0]
+            seconds = time.perf_counter() - t0
+            if end == chunk + HOUR:   # tranche complète ; une partielle est refaite au prochain passage
+                cur.execute("""
+                  INSERT INTO backfill_checkpoints(job, tenant, chunk, rows, seconds) VALUES (%s, %s, %s, %s, %s)
+                  ON CONFLICT (job, tenant, chunk) DO UPDATE
+                    SET rows=EXCLUDED.rows, seconds=EXCLUDED.seconds, done_at=NOW()
+                """, (job, tenant, chunk, rows, seconds))
+        CONN.commit()
+        return rows, seconds
+    except Exception:
+        CONN.rollback()
+        raise
+
+
+def spikes(args) -> int:
+    if args.step <= 0 or 3600 % args.step:
+        raise SystemExit("--step doit diviser 3600")
+    if args.start.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0) != args.start:
+        raise SystemExit("--from doit tomber sur une heure pleine (ex. 2026-09-01T13:00)")
+    args.end = min(args.end or datetime.now(timezone.utc), datetime.now(timezone.utc))
+    tenants = [t for t in agg.TENANTS if not args.tenant or t["tenant"] in args.tenant]
+    chunks = [(t, h) for h in hours(args.start, args.end) for t in tenants]
+
+    conn = agg.connect()
+    with conn.cursor() as cur:
+        cur.execute("""SELECT tenant, chunk FROM backfill_checkpoints
+                       WHERE job=%s AND chunk >= %s AND chunk < %s""", (args.job, args.start, args.end))
+        done = set() if args.force else set(cur.fetchall())
+    conn.close()
+    todo = [(t, h) for t, h in chunks if (t["tenant"], h) not in done]
+    log(f"job {args.job} : {len(chunks)} tranches, {len(chunks) - len(todo)} déjà faites, "
+        f"{len(todo)} à calculer sur {args.workers} processus (pas {args.step}s)")
+
+    failed = 0
+    total = 0
+    with ProcessPoolExecutor(args.workers, initializer=init_worker) as ex:
+        futures = {ex.submit(run_chunk, args.job, t["tenant"], bool(t.get("news")), bool(t.get("wiki")),
+                             h, args.step, args.end): (t["tenant"], h) for t, h in todo}
+        for i, fut in enumerate(as_completed(futures), 1):
+            tenant, h = futures[fut]
+            try:
+                rows, seconds = fut.result()
+                total += rows
+                partial = " (partielle, non notée)" if h + HOUR > args.end else ""
+                log(f"[{i}/{len(todo)}] {tenant} {h:%Y-%m-%d %H:00} : {rows} lignes en {seconds:.1f}s{partial}")
+            except Exception as exc:
+                failed += 1
+                log(f"[{i}/{len(todo)}] {tenant} {h:%Y-%m-%d %H:00} : échec ({exc})")
+    log(f"terminé : {total} lignes, {failed} tranche(s) en échec" + (" → relancer le même job" if failed else ""))
+    return 1 if failed else 0
+
+
+# ------------------------------------------------------------- reset-group
+
+def reset_group(args) -> int:
+    from kafka import KafkaConsumer, TopicPartition
+    from kafka.errors import CommitFailedError
+    from kafka.structs import OffsetAndMetadata
+
+    # wiki_rc n'a pas de clé : rejouer le wiki dupliquerait les éditions → --topics explicite
+    names = args.topics or topics(agg.TENANTS, "news")
+    consumer = KafkaConsumer(bootstrap_servers=agg.BOOT, group_id=args.group, enable_auto_commit=False)
+    tps = [TopicPartition(t, p) for t in names for p in sorted(consumer.partitions_for_topic(t) or ())]
+    if not tps:
+        raise SystemExit(f"aucune partition pour {', '.join(names)}")
+    consumer.assign(tps)
+    found = consumer.offsets_for_times({tp: int(args.at.timestamp() * 1000) for tp in tps})
+    ends = consumer.end_offsets(tps)
+    # aucun message après la date : fin de partition
+    offsets = {tp: found[tp].offset if found.get(tp) else ends[tp] for tp in tps}
+    for tp in tps:
+        log(f"{args.group} {tp.topic}[{tp.partition}] → {offsets[tp]} (fin {ends[tp]})")
+    if args.dry_run:
+        return 0
+    try:
+        consumer.commit({tp: OffsetAndMetadata(off, None) for tp, off in offsets.items()})
+    except CommitFailedError as exc:
+        raise SystemExit(f"commit refusé ({exc}) : arrêter les consumers du groupe puis relancer")
+    finally:
+        consumer.close(autocommit=False)
+    log(f"groupe {args.group} rembobiné au {args.at.isoformat()}"
+        + (" ; spike-aggregator en mode stream : supprimer aussi STATE_FILE" if args.group == agg.GROUP else ""))
+    return 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Rejeu d'une période passée / rembobinage d'un consumer group")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("spikes", help="recalcule spikes_entities / spikes_news / spikes_wiki par heure")
+    s.add_argument("--from", dest="start", type=parse_ts, required=True, help="début (ISO, UTC par défaut)")
+    s.add_argument("--to", dest="end", type=parse_ts, help="fin exclue (défaut : maintenant)")
+    s.add_argument("--job", default="spikes", help="nom du job (reprise sur checkpoint)")
+    s.add_argument("--step", type=int, default=300, help="secondes entre deux instantanés")
+    s.add_argument("--workers", type=int, default=4, help="processus en parallèle")
+    s.add_argument("--tenant", action="append", help="restreindre à ce tenant (répétable)")
+    s.add_argument("--force", action="store_true", help="ignorer les tranches déjà faites")
+    r = sub.add_parser("reset-group", help="rembobine un consumer group à une date")
+    r.add_argument("--group", required=True)
+    r.add_argument("--at", type=parse_ts, required=True, help="date (ISO, UTC par défaut)")
+    r.add_argument("--topics", type=lambda v: [t for t in v.split(",") if t], help="par défaut : topics news des tenants (le wiki serait dupliqué)")
+    r.add_argument("--dry-run", action="store_true", help="affiche les offsets sans les appliquer")
+    args = ap.parse_args()
+    sys.exit(spikes(args) if args.cmd == "spikes" else reset_group(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,29 @@
-import os, time, psycopg2, re
+import os, time, psycopg2, re, json, pickle
 from collections import Counter, defaultdict
-from datetime import datetime
+from datetime import datetime, timezone
+from psycopg2.extras import execute_values
+from common.canon import title_hash, url_key
+from common.metrics import AGG_PHASE_SECONDS, AGG_TICK_SECONDS, start_metrics_server
+from common.profiling import Profiler
+from common.tenants import DEFAULT_TENANT, load_tenants, tenant_of, topics
 
 DBH=os.getenv("DB_HOST","postgres"); DBN=os.getenv("DB_NAME","trends"); DBU=os.getenv("DB_USER","trends"); DBP=os.getenv("DB_PASS","trends"); DBPORT=int(os.getenv("DB_PORT","5432"))
 STEP=int(os.getenv("STEP_SEC","30"))
+WIKI_WINDOW=int(os.getenv("WIKI_WINDOW_MIN","10"))
+NOTIFY_CHANNEL=os.getenv("NOTIFY_CHANNEL","trends_tick")   # écouté par read_api
+
+# Mode "stream" : consomme Kafka directement au lieu de relire news_articles
+MODE=os.getenv("AGG_MODE","db")
+BOOT=os.getenv("KAFKA_BOOTSTRAP_SERVERS","kafka:29092")
+TOPIC_NEWS=os.getenv("TOPIC_NEWS","news_fr"); TOPIC_WIKI=os.getenv("TOPIC_WIKI","wiki_rc")
+GROUP=os.getenv("AGG_GROUP","spike-aggregator")
+STREAM_STEP=float(os.getenv("STREAM_STEP_SEC","1"))      # publication du top-K
+STATE_FILE=os.getenv("STATE_FILE","/state/aggregator.pkl")
+SNAPSHOT_SEC=int(os.getenv("SNAPSHOT_SEC","60"))
+ENTITIES_ROLL_SEC=int(os.getenv("ENTITIES_ROLL_SEC","60"))   # nouveau lot spikes_entities
+TENANTS=load_tenants({"tenant": DEFAULT_TENANT, "news": {"topic": TOPIC_NEWS}, "wiki": {"topic": TOPIC_WIKI}})
+WIKI_TOPICS=set(topics(TENANTS, "wiki"))
+PROF=Profiler("spike-aggregator", AGG_PHASE_SECONDS)
 
 TOKEN = re.compile(r"[A-Za-zÀ-ÖØ-öø-ÿ']+")
 CAP_SEQ = re.compile(r"\b(?:[A-Z][\wÀ-ÖØ-öø-ÿ'-]{2,}(?:\s+[A-Z][\wÀ-ÖØ-öø-ÿ'-]{2,})+)\b")
@@ -22,22 +42,41 @@ def toks(s):
     ws = [w.lower().strip("’'") for w in TOKEN.findall(s or "")]
     return [w for w in ws if w and w not in STOP and len(w)>2]
 
-def top_phrases(cur, minutes, kind):
-    cur.execute("""
-      SELECT source, title
-      FROM news_articles
-      WHERE kind=%s AND published_ts >= NOW() - (%s || ' minutes')::interval
-    """,[kind, minutes])
+# `at` : instant de calcul. None = maintenant (service) ; une date = rejeu
+# (backfill.py), la fenêtre s'arrête alors à `at`.
+
+def top_phrases(cur, minutes, kind, tenant, at=None):
+    with PROF.phase("query"):
+        cur.execute("""
+          SELECT source, title
+          FROM news_articles
+          WHERE tenant=%s AND kind=%s
+            AND published_ts >= COALESCE(%s::timestamptz, NOW()) - (%s || ' minutes')::interval
+            AND published_ts <= COALESCE(%s::timestamptz, 'infinity')
+        """,[tenant, kind, at, minutes, at])
+        fetched = cur.fetchall()
+    with PROF.phase("tokenize"):
+        return score_titles(fetched)
+
+def terms(title):
+    """(unigrammes, bigrammes, entités) d'un titre."""
+    w = toks(title or "")
+    return w, [f"{w[i]} {w[i+1]}" for i in range(len(w)-1)], CAP_SEQ.findall(title or "")
+
+def score_titles(fetched):
     uni=Counter(); bi=Counter(); ent=Counter(); srcmap=defaultdict(set)
-    for source, title in cur.fetchall():
-        w = toks(title or "")
-        for p in CAP_SEQ.findall(title or ""):
+    for source, title in fetched:
+        w, bis, ents = terms(title)
+        for p in ents:
             ent[p]+=1; srcmap[p].add(source)
         for t in w:
             uni[t]+=1; srcmap[t].add(source)
-        for i in range(len(w)-1):
-            bg=f"{w[i]} {w[i+1]}"; bi[bg]+=1; srcmap[bg].add(source)
+        for bg in bis:
+            bi[bg]+=1; srcmap[bg].add(source)
+    return rank(uni, bi, ent, srcmap)
 
+def rank(uni, bi, ent, srcmap):
+    # srcmap : phrase -> sources distinctes (set, ou Counter en mode stream)
     score=Counter()
     for k,v in uni.items(): score[k]+=v         # 1x
     for k,v in bi.items():  score[k]+=v*2       # 2x bigrams
@@ -48,43 +87,317 @@ def top_phrases(cur, minutes, kind):
         rows.append((phrase, int(sc), len(srcmap[phrase])))
     return rows
 
-def write_entities(cur, rows, kind_tag):
-    # Nettoyage fenêtre récente pour ce type
-    cur.execute("DELETE FROM spikes_entities WHERE ts >= NOW()-interval '5 minutes' AND kind=%s", [kind_tag])
-    for phrase, mentions, nb_src in rows:
-        score = float(mentions + 0.7*nb_src)
-        cur.execute("""
-          INSERT INTO spikes_entities(ts, phrase, kind, mentions, sources, score)
-          VALUES(NOW(), %s, %s, %s, %s, %s)
-          ON CONFLICT (ts, phrase, kind) DO NOTHING
-        """, (phrase, kind_tag, mentions, nb_src, score))
+def entity_values(rows, kind_tag, tenant, at):
+    return [(at, phrase, kind_tag, mentions, nb_src, float(mentions + 0.7*nb_src), tenant)
+            for phrase, mentions, nb_src in rows]
 
-def main():
-    conn=connect(); cur=conn.cursor()
-    while True:
-        # spikes_news (30 min) basé sur le flux continu
+def write_entities(cur, rows, kind_tag, tenant, at=None):
+    # Nettoyage fenêtre récente pour ce type (le backfill vide lui-même ses tranches)
+    if at is None:
+        cur.execute("DELETE FROM spikes_entities WHERE ts >= NOW()-interval '5 minutes' AND kind=%s AND tenant=%s",
+                    [kind_tag, tenant])
+    if not rows:
+        return
+    execute_values(cur, """
+      INSERT INTO spikes_entities(ts, phrase, kind, mentions, sources, score, tenant) VALUES %s
+      ON CONFLICT (ts, phrase, kind, tenant) DO UPDATE
+        SET mentions=EXCLUDED.mentions, sources=EXCLUDED.sources, score=EXCLUDED.score
+    """, entity_values(rows, kind_tag, tenant, at),
+       template="(COALESCE(%s::timestamptz, NOW()), %s, %s, %s, %s, %s, %s)")
+
+def wiki_spikes(cur, minutes, tenant, at=None):
+    # pages les plus éditées sur la fenêtre, un seul NOW() pour tout le lot
+    cur.execute("""
+      INSERT INTO spikes_wiki(ts, page, edits_15m, score_norm, tenant)
+      SELECT COALESCE(%(at)s::timestamptz, NOW()), page, c, c::float / MAX(c) OVER (), %(tenant)s
+      FROM (
+        SELECT page, COUNT(*) c
+        FROM wiki_rc
+        WHERE tenant=%(tenant)s AND page IS NOT NULL
+          AND ts >= COALESCE(%(at)s::timestamptz, NOW()) - (%(minutes)s || ' minutes')::interval
+          AND ts <= COALESCE(%(at)s::timestamptz, 'infinity')
+        GROUP BY page
+        ORDER BY c DESC
+        LIMIT 50
+      ) t
+      ON CONFLICT DO NOTHING
+    """, {"tenant": tenant, "minutes": minutes, "at": at})
+
+def news_spikes(cur, tenant, at=None):
+    # spikes_news (30 min) basé sur le flux continu
+    with PROF.phase("query"):
         cur.execute("""
-          INSERT INTO spikes_news(ts, keyword, count_30m, score_norm)
-          SELECT NOW(), k, c, c::float
+          INSERT INTO spikes_news(ts, keyword, count_30m, score_norm, tenant)
+          SELECT COALESCE(%(at)s::timestamptz, NOW()), k, c, c::float, %(tenant)s
           FROM (
             SELECT unnest(string_to_array(lower(regexp_replace(title,'[^A-Za-zÀ-ÖØ-öø-ÿ ]',' ','g')), ' ')) AS k,
                    COUNT(*) c
             FROM news_articles
-            WHERE kind='continu' AND published_ts >= NOW() - interval '30 minutes'
+            WHERE tenant=%(tenant)s AND kind='continu'
+              AND published_ts >= COALESCE(%(at)s::timestamptz, NOW()) - interval '30 minutes'
+              AND published_ts <= COALESCE(%(at)s::timestamptz, 'infinity')
             GROUP BY 1
-            HAVING length(k)>2 AND k NOT IN %s
+            HAVING length(k)>2 AND k NOT IN %(stop)s
             ORDER BY c DESC
             LIMIT 100
           ) t
           ON CONFLICT DO NOTHING
-        """, (tuple(STOP),))
+        """, {"tenant": tenant, "at": at, "stop": tuple(STOP)})
+
+    # Entités pour 60 min (continu) et 24 h (une)
+    rows = top_phrases(cur, 60, 'continu', tenant, at)[:50]
+    with PROF.phase("write"):
+        write_entities(cur, rows, 'news_continu', tenant, at)
+    rows = top_phrases(cur, 1440, 'une', tenant, at)[:50]
+    with PROF.phase("write"):
+        write_entities(cur, rows, 'news_une', tenant, at)
+
+def tick(cur):
+    # un passage par tenant : chaque marché a ses propres tendances
+    for t in TENANTS:
+        if t.get("news"): news_spikes(cur, t["tenant"])
+        if t.get("wiki"):
+            with PROF.phase("query"):
+                wiki_spikes(cur, WIKI_WINDOW, t["tenant"])
+    cur.execute(f"NOTIFY {NOTIFY_CHANNEL}")
+
+# ---------------------------------------------------------------- mode stream
+# Fenêtres glissantes en mémoire, découpées en seaux d'une minute (temps de
+# publication, comme le filtre SQL). Les totaux de fenêtre sont tenus à jour
+# à l'ajout et au retrait d'un seau : publier le top-K ne relit rien.
+
+SQL_WORD = re.compile(r"[^A-Za-zÀ-ÖØ-öø-ÿ ]")
+
+def sql_words(title):
+    # même découpage que la requête spikes_news du mode db
+    ws = SQL_WORD.sub(" ", title or "").lower().split(" ")
+    return [w for w in ws if len(w)>2 and w not in STOP]
+
+def news_keys(rec):
+    # mêmes clés que db_writer : URL canonique (ON CONFLICT), titre par source (title_hash)
+    url=rec.get("url_canon") or url_key(rec.get("url") or "")
+    th=rec.get("title_hash") or title_hash(rec.get("title"))
+    return [k for k in (url and ("url", url), th and ("title", rec.get("source"), th)) if k]
+
+class SeenKeys:
+    """Clés déjà comptées dans une fenêtre, rangées par seau : un article renvoyé
+    ou republié ne compte qu'une fois, comme dans news_articles."""
+    def __init__(self):
+        self.by_min={}; self.all=set()
+
+    def first(self, m, keys):
+        if any(k in self.all for k in keys): return False
+        self.all.update(keys); self.by_min.setdefault(m, set()).update(keys)
+        return True
+
+    def forget(self, minutes):
+        for m in minutes: self.all -= self.by_min.pop(m, set())
+
+class PhraseWindow:
+    """uni/bi/entités + sources distinctes sur les `minutes` dernières minutes."""
+    def __init__(self, minutes):
+        self.minutes=minutes; self.buckets={}; self.seen=SeenKeys()
+        self.uni=Counter(); self.bi=Counter(); self.ent=Counter(); self.src=defaultdict(Counter)
 
-        # Entités pour 60 min (continu) et 24 h (une)
-        rows = top_phrases(cur, 60, 'continu')[:50]
-        write_entities(cur, rows, 'news_continu')
-        rows = top_phrases(cur, 1440, 'une')[:50]
-        write_entities(cur, rows, 'news_une')
+    def __setstate__(self, st):   # snapshot antérieur au dédoublonnage
+        self.__dict__.update(st); self.__dict__.setdefault("seen", SeenKeys())
 
+    def add(self, ts, source, title, keys=()):
+        m=int(ts//60)
+        if m <= int(time.time()//60) - self.minutes: return
+        if not self.seen.first(m, keys): return
+        b=self.buckets.get(m)
+        if b is None: b=self.buckets[m]=(Counter(), Counter(), Counter(), Counter())
+        w, bis, ents = terms(title)
+        for c, tot, items in ((b[0], self.uni, w), (b[1], self.bi, bis), (b[2], self.ent, ents)):
+            for t in items:
+                c[t]+=1; tot[t]+=1; b[3][(t, source)]+=1; self.src[t][source]+=1
+
+    def expire(self, now):
+        old=[m for m in self.buckets if m <= int(now//60) - self.minutes]
+        for m in old:
+            uni, bi, ent, src = self.buckets.pop(m)
+            self.uni.subtract(uni); self.bi.subtract(bi); self.ent.subtract(ent)
+            for (t, source), n in src.items():
+                c=self.src[t]; c[source]-=n
+                if c[source]<=0: del c[source]
+                if not c: del self.src[t]
+        self.seen.forget(old)
+        if old:   # subtract() laisse des zéros
+            for tot in (self.uni, self.bi, self.ent):
+                for k in [k for k,v in tot.items() if v<=0]: del tot[k]
+        return bool(old)
+
+    def top(self):
+        return rank(self.uni, self.bi, self.ent, self.src)
+
+class CountWindow:
+    """Compteur simple (mots-clés spikes_news, pages wiki) sur `minutes`."""
+    def __init__(self, minutes):
+        self.minutes=minutes; self.buckets={}; self.total=Counter(); self.seen=SeenKeys()
+
+    def __setstate__(self, st):
+        self.__dict__.update(st); self.__dict__.setdefault("seen", SeenKeys())
+
+    def add(self, ts, keys, dedup=()):
+        m=int(ts//60)
+        if m <= int(time.time()//60) - self.minutes: return
+        if not self.seen.first(m, dedup): return
+        b=self.buckets.setdefault(m, Counter())
+        b.update(keys); self.total.update(keys)
+
+    def expire(self, now):
+        old=[m for m in self.buckets if m <= int(now//60) - self.minutes]
+        for m in old:
+            self.total.subtract(self.buckets.pop(m))
+        self.seen.forget(old)
+        if old:
+            for k in [k for k,v in self.total.items() if v<=0]: del self.total[k]
+        return bool(old)
+
+def new_windows():
+    return {"news_continu": PhraseWindow(60), "news_une": PhraseWindow(1440),
+            "keywords": CountWindow(30), "wiki": CountWindow(WIKI_WINDOW)}
+
+def ingest(wins, topic, rec):
+    # wins : tenant -> fenêtres (defaultdict(new_windows))
+    now=time.time(); wins=wins[tenant_of(rec)]
+    if topic in WIKI_TOPICS:
+        if rec.get("page"): wins["wiki"].add(min(rec.get("ts") or now, now), [rec["page"]])
+        return
+    ts=min(rec.get("published_ts") or now, now)
+    kind=rec.get("kind","continu")
+    keys=news_keys(rec)
+    wins["news_une" if kind=="une" else "news_continu"].add(ts, rec.get("source"), rec.get("title"), keys)
+    if kind=="continu": wins["keywords"].add(ts, sql_words(rec.get("title")), keys)
+
+def load_state():
+    try:
+        with open(STATE_FILE,"rb") as f: st=pickle.load(f)
+        if "news_continu" in st["windows"]:   # snapshot antérieur aux tenants
+            st["windows"]={DEFAULT_TENANT: st["windows"]}
+        st["windows"]=defaultdict(new_windows, st["windows"])
+        print(f"état restauré depuis {STATE_FILE} ({len(st['offsets'])} partitions)", flush=True)
+        return st
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"état illisible ({e}) → reconstruction depuis Kafka", flush=True)
+        return None
+
+def save_state(wins, offsets):
+    os.makedirs(os.path.dirname(STATE_FILE) or ".", exist_ok=True)
+    tmp=STATE_FILE+".tmp"
+    with open(tmp,"wb") as f: pickle.dump({"windows": dict(wins), "offsets": dict(offsets)}, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, STATE_FILE)
+
+def stream_consumer(offsets):
+    from kafka import KafkaConsumer, ConsumerRebalanceListener
+
+    longest=max(w.minutes for w in new_windows().values())
+    class Rewind(ConsumerRebalanceListener):
+        # reprend à l'offset du snapshot, sinon rejoue la plus longue fenêtre
+        def on_partitions_revoked(self, revoked): pass
+        def on_partitions_assigned(self, assigned):
+            missing=[tp for tp in assigned if tp not in offsets]
+            for tp in assigned:
+                if tp in offsets: consumer.seek(tp, offsets[tp])
+            if missing:
+                since=int((time.time() - longest*60)*1000)
+                for tp, ot in consumer.offsets_for_times({tp: since for tp in missing}).items():
+                    if ot is None: consumer.seek_to_end(tp)
+                    else: consumer.seek(tp, ot.offset)
+
+    consumer=KafkaConsumer(bootstrap_servers=BOOT, group_id=GROUP, enable_auto_commit=False,
+                           value_deserializer=lambda v: json.loads(v.decode("utf-8")))
+    consumer.subscribe(topics(TENANTS, "news") + topics(TENANTS, "wiki"), listener=Rewind())
+    return consumer
+
+def sync_entities(cur, rows, kind_tag, tenant, ts, roll):
+    # Le lot `ts` est mis à jour en place : seules les lignes changées sont
+    # réécrites, seules les phrases sorties du top sont supprimées.
+    if roll:   # nouveau lot : remplace le précédent, comme write_entities
+        cur.execute("DELETE FROM spikes_entities WHERE ts >= %s - interval '5 minutes' AND kind=%s AND tenant=%s",
+                    [ts, kind_tag, tenant])
+    if rows:
+        execute_values(cur, """
+          INSERT INTO spikes_entities(ts, phrase, kind, mentions, sources, score, tenant) VALUES %s
+          ON CONFLICT (ts, phrase, kind, tenant) DO UPDATE
+            SET mentions=EXCLUDED.mentions, sources=EXCLUDED.sources, score=EXCLUDED.score
+            WHERE (spikes_entities.mentions, spikes_entities.sources)
+                  IS DISTINCT FROM (EXCLUDED.mentions, EXCLUDED.sources)
+        """, entity_values(rows, kind_tag, tenant, ts))
+    if not roll:
+        cur.execute("DELETE FROM spikes_entities WHERE ts=%s AND kind=%s AND tenant=%s AND phrase <> ALL(%s)",
+                    [ts, kind_tag, tenant, [r[0] for r in rows]])
+
+def publish_entities(cur, wins, batch):
+    # batch : {"ts": lot en cours, "at": sa création} ; nouveau lot toutes les ENTITIES_ROLL_SEC
+    rows={(tenant, tag): w[tag].top()[:50] for tenant, w in wins.items() for tag in ("news_continu","news_une")}
+    roll=time.time() - batch["at"] >= ENTITIES_ROLL_SEC
+    if roll: batch.update(ts=datetime.now(timezone.utc), at=time.time())
+    with PROF.phase("write"):
+        cur.execute("BEGIN")   # le lecteur ne voit jamais un lot à moitié écrit
+        try:
+            for (tenant, tag), r in rows.items(): sync_entities(cur, r, tag, tenant, batch["ts"], roll)
+        except Exception:
+            cur.execute("ROLLBACK"); raise
+        cur.execute("COMMIT")
+        cur.execute(f"NOTIFY {NOTIFY_CHANNEL}")
+
+def publish_counts(cur, wins):
+    with PROF.phase("write"):
+        kw=[]; pages=[]
+        for tenant, w in wins.items():
+            kw += [(k, c, float(c), tenant) for k, c in w["keywords"].total.most_common(100)]
+            top=w["wiki"].total.most_common(50)
+            pages += [(p, c, c/top[0][1], tenant) for p, c in top]
+        if kw:
+            execute_values(cur, """
+              INSERT INTO spikes_news(ts, keyword, count_30m, score_norm, tenant) VALUES %s ON CONFLICT DO NOTHING
+            """, kw, template="(NOW(), %s, %s, %s, %s)")
+        if pages:
+            execute_values(cur, """
+              INSERT INTO spikes_wiki(ts, page, edits_15m, score_norm, tenant) VALUES %s ON CONFLICT DO NOTHING
+            """, pages, template="(NOW(), %s, %s, %s, %s)")
+
+def run_stream(conn, cur):
+    st=load_state()
+    wins=st["windows"] if st else defaultdict(new_windows)
+    offsets=st["offsets"] if st else {}
+    consumer=stream_consumer(offsets)
+    dirty=False; last_pub=last_counts=last_snap=0.0; batch={"ts": None, "at": 0.0}
+    while True:
+        polled=consumer.poll(timeout_ms=int(STREAM_STEP*1000), max_records=5000)
+        now=time.time()
+        due=now - last_pub >= STREAM_STEP
+        counts=now - last_counts >= STEP
+        if polled or due or counts:
+            # un seul tick : tokenize et write apparaissent dans le même rapport
+            with PROF.tick(conn, AGG_TICK_SECONDS):
+                if polled:
+                    with PROF.phase("tokenize"):
+                        for tp, msgs in polled.items():
+                            for m in msgs: ingest(wins, m.topic, m.value)
+                            offsets[tp]=msgs[-1].offset+1
+                    dirty=True
+                if due:
+                    for tw in wins.values():
+                        for w in tw.values(): dirty |= w.expire(now)
+                    if dirty: publish_entities(cur, wins, batch); dirty=False
+                    last_pub=now
+                if counts: publish_counts(cur, wins); last_counts=now
+        if now - last_snap >= SNAPSHOT_SEC:
+            save_state(wins, offsets); consumer.commit(); last_snap=now
+
+def main():
+    start_metrics_server(); PROF.install_signals()
+    conn=connect(); cur=conn.cursor(cursor_factory=PROF.cursor_factory())
+    if MODE == "stream":
+        return run_stream(conn, cur)
+    while True:
+        with PROF.tick(conn, AGG_TICK_SECONDS):
+            tick(cur)
         time.sleep(STEP)
 
 if __name__=="__main__":
@@ -0,0 +1,143 @@
+"""One-time dedup of ``news_articles`` on an existing database.
+
+Fills ``url_canon`` / ``title_hash`` with the producers' own functions
+(``common/canon.py``), deletes duplicates (the first ingested row wins, same
+rules as ``db_writer``), then builds the indexes of ``migrate_05_dedup.sql``
+with ``CREATE INDEX CONCURRENTLY``. Every UPDATE/DELETE covers one id range
+and commits on its own, so no lock is held for more than a batch and the
+writers keep running. Safe to re-run: indexes left INVALID by an
+interrupted run are dropped and rebuilt.
+
+    PYTHONPATH=. python db/dedup_news.py --batch 5000 --pause 0.05
+"""
+import argparse
+import os
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from common.canon import title_hash, url_key
+
+DBH = os.getenv("DB_HOST", "localhost")
+DBN = os.getenv("DB_NAME", "trends")
+DBU = os.getenv("DB_USER", "trends")
+DBP = os.getenv("DB_PASS", "trends")
+DBPORT = int(os.getenv("DB_PORT", "5432"))
+
+URL_DUPES = """
+  DELETE FROM news_articles a
+  WHERE a.id > %s AND a.id <= %s AND a.url_canon IS NOT NULL AND EXISTS (
+    SELECT 1 FROM news_articles b
+    WHERE b.tenant = a.tenant AND b.kind = a.kind AND b.url_canon = a.url_canon AND b.id < a.id)
+"""
+TITLE_DUPES = """
+  DELETE FROM news_articles a
+  WHERE a.id > %s AND a.id <= %s AND a.title_hash IS NOT NULL AND EXISTS (
+    SELECT 1 FROM news_articles b
+    WHERE b.title_hash = a.title_hash AND b.source = a.source
+      AND b.tenant = a.tenant AND b.kind = a.kind AND b.id < a.id
+      AND b.published_ts > a.published_ts - interval '2 days')
+"""
+
+
+def log(msg: str) -> None:
+    print(f"[dedup] {msg}", flush=True)
+
+
+def index_valid(cur, name: str):
+    """``None`` if the index does not exist, else its ``pg_index.indisvalid``."""
+    cur.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (name,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def drop_invalid(cur, name: str) -> None:
+    """An interrupted CONCURRENTLY leaves an INVALID index that IF NOT EXISTS would keep."""
+    if index_valid(cur, name) is False:
+        log(f"index {name} invalide (exécution interrompue) → reconstruit")
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def backfill(cur, batch: int, pause: float) -> int:
+    done, last = 0, 0
+    while True:
+        cur.execute("""
+          SELECT id, url, title FROM news_articles
+          WHERE id > %s AND url_canon IS NULL ORDER BY id LIMIT %s
+        """, (last, batch))
+        rows = cur.fetchall()
+        if not rows:
+            return done
+        execute_values(cur, """
+          UPDATE news_articles n SET url_canon = v.c, title_hash = v.h
+          FROM (VALUES %s) AS v(id, c, h) WHERE n.id = v.id
+        """, [(i, url_key(u) or None, title_hash(t)) for i, u, t in rows], template="(%s, %s, %s::bigint)")
+        done += len(rows)
+        last = rows[-1][0]
+        log(f"clés calculées : {done}")
+        time.sleep(pause)
+
+
+def delete_dupes(cur, start: int, batch: int, pause: float) -> int:
+    cur.execute("SELECT COALESCE(MAX(id), 0) FROM news_articles")
+    top = cur.fetchone()[0]
+    deleted = 0
+    for lo in range(start, top, batch):
+        for sql in (URL_DUPES, TITLE_DUPES):
+            cur.execute(sql, (lo, lo + batch))
+            deleted += cur.rowcount
+        if deleted:
+            log(f"ids ≤ {min(lo + batch, top)} : {deleted} doublons supprimés")
+        time.sleep(pause)
+    return top
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Dédoublonnage par lots de news_articles")
+    ap.add_argument("--batch", type=int, default=5000, help="lignes par transaction")
+    ap.add_argument("--pause", type=float, default=0.05, help="pause entre lots (s)")
+    args = ap.parse_args()
+
+    conn = psycopg2.connect(host=DBH, dbname=DBN, user=DBU, password=DBP, port=DBPORT)
+    conn.autocommit = True   # une transaction par lot ; requis par CONCURRENTLY
+    cur = conn.cursor()
+    cur.execute("ALTER TABLE news_articles ADD COLUMN IF NOT EXISTS url_canon TEXT")
+    cur.execute("ALTER TABLE news_articles ADD COLUMN IF NOT EXISTS title_hash BIGINT")
+
+    backfill(cur, args.batch, args.pause)
+    log("index de travail…")
+    for name in ("news_articles_title_hash_idx", "news_articles_canon_tmp", "news_articles_canon_uniq"):
+        drop_invalid(cur, name)
+    cur.execute("""CREATE INDEX CONCURRENTLY IF NOT EXISTS news_articles_title_hash_idx
+                   ON news_articles(title_hash, source) WHERE title_hash IS NOT NULL""")
+    cur.execute("""CREATE INDEX CONCURRENTLY IF NOT EXISTS news_articles_canon_tmp
+                   ON news_articles(tenant, kind, url_canon)""")
+    seen = delete_dupes(cur, 0, args.batch, args.pause)
+
+    # l'ancien db_writer a pu insérer pendant ce temps : on reprend la queue
+    for attempt in range(3):
+        backfill(cur, args.batch, args.pause)
+        seen = delete_dupes(cur, max(seen - args.batch, 0), args.batch, args.pause)
+        try:
+            cur.execute("""CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS news_articles_canon_uniq
+                           ON news_articles(tenant, kind, url_canon)""")
+            if index_valid(cur, "news_articles_canon_uniq"):
+                break   # CONCURRENTLY peut échouer sans exception et laisser un index INVALID
+            drop_invalid(cur, "news_articles_canon_uniq")
+        except psycopg2.errors.UniqueViolation:
+            log("doublon arrivé pendant la création de l'index, nouvel essai")
+            cur.execute("DROP INDEX CONCURRENTLY IF EXISTS news_articles_canon_uniq")
+    else:
+        raise SystemExit("index unique impossible : arrêter db_writer puis relancer")
+
+    # app/ingest.py gardait l'ancienne contrainte tant que l'index canonique manquait
+    cur.execute("ALTER TABLE news_articles DROP CONSTRAINT IF EXISTS news_articles_url_key")
+    cur.execute("DROP INDEX CONCURRENTLY IF EXISTS news_articles_canon_tmp")
+    log("VACUUM (ANALYZE)…")
+    cur.execute("VACUUM (ANALYZE) news_articles")
+    log("terminé")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+-- Multi-marchés : chaque ligne porte son tenant (fr, be, ch, ca, en…)
+-- ADD COLUMN … DEFAULT est instantané (pas de réécriture de table, PG ≥ 11)
+ALTER TABLE news_articles   ADD COLUMN IF NOT EXISTS tenant TEXT NOT NULL DEFAULT 'fr';
+ALTER TABLE wiki_rc         ADD COLUMN IF NOT EXISTS tenant TEXT NOT NULL DEFAULT 'fr';
+ALTER TABLE spikes_news     ADD COLUMN IF NOT EXISTS tenant TEXT NOT NULL DEFAULT 'fr';
+ALTER TABLE spikes_entities ADD COLUMN IF NOT EXISTS tenant TEXT NOT NULL DEFAULT 'fr';
+ALTER TABLE spikes_wiki     ADD COLUMN IF NOT EXISTS tenant TEXT NOT NULL DEFAULT 'fr';
+
+-- les tendances de deux tenants peuvent partager ts/phrase
+ALTER TABLE spikes_news     DROP CONSTRAINT IF EXISTS spikes_news_pkey,     ADD PRIMARY KEY (ts, keyword, tenant);
+ALTER TABLE spikes_entities DROP CONSTRAINT IF EXISTS spikes_entities_pkey, ADD PRIMARY KEY (ts, phrase, kind, tenant);
+ALTER TABLE spikes_wiki     DROP CONSTRAINT IF EXISTS spikes_wiki_pkey,     ADD PRIMARY KEY (ts, page, tenant);
+
+CREATE INDEX IF NOT EXISTS news_articles_tenant_kind_idx ON news_articles(tenant, kind, published_ts DESC);
+CREATE INDEX IF NOT EXISTS wiki_rc_tenant_ts_idx ON wiki_rc(tenant, ts DESC);
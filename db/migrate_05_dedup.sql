@@ -0,0 +1,12 @@
+-- Clés de dédoublonnage des articles, calculées par les producers (common/canon.py)
+--   url_canon  : URL sans schéma, www., slash final ni paramètres de suivi (utm_*, xtor, at_*…)
+--   title_hash : hash 64 bits du titre normalisé (même dépêche republiée sous une autre URL)
+-- Base existante avec des doublons : lancer d'abord db/dedup_news.py, qui remplit
+-- et purge par lots puis crée ces index CONCURRENTLY (pas de verrou long).
+ALTER TABLE news_articles ADD COLUMN IF NOT EXISTS url_canon  TEXT;
+ALTER TABLE news_articles ADD COLUMN IF NOT EXISTS title_hash BIGINT;
+
+-- un article par (tenant, kind) : la même URL peut être en une et en continu
+CREATE UNIQUE INDEX IF NOT EXISTS news_articles_canon_uniq ON news_articles(tenant, kind, url_canon);
+CREATE INDEX IF NOT EXISTS news_articles_title_hash_idx ON news_articles(title_hash, source)
+  WHERE title_hash IS NOT NULL;
@@ -0,0 +1,38 @@
+-- Index des requêtes de fenêtre (dashboard, spike_aggregator, read_api).
+-- Toutes filtrent tenant + kind + plage de temps puis lisent source/title/url :
+-- avec INCLUDE elles deviennent des Index Only Scan, sans accès au heap.
+-- CONCURRENTLY : applicable sur une base en service (psql -f, hors transaction).
+-- Mesure avant/après : python -m bench.explain capture / compare.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS news_articles_window_idx
+  ON news_articles(tenant, kind, published_ts DESC) INCLUDE (source, title, url);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS wiki_rc_window_idx
+  ON wiki_rc(tenant, ts DESC) INCLUDE (page, delta, url);
+
+-- Longs parcours (backfill, analyses sur des semaines) : BRIN, quelques pages
+-- pour toute la table, les lignes arrivant à peu près dans l'ordre du temps.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS news_articles_published_brin
+  ON news_articles USING brin(published_ts) WITH (pages_per_range = 32);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS news_articles_ingest_brin
+  ON news_articles USING brin(ts_ingest) WITH (pages_per_range = 32);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS wiki_rc_ts_brin
+  ON wiki_rc USING brin(ts) WITH (pages_per_range = 32);
+
+-- Dernier lot par (tenant, kind) pour read_api : MAX(ts) sans parcourir le PK
+CREATE INDEX CONCURRENTLY IF NOT EXISTS spikes_entities_tenant_kind_ts_idx
+  ON spikes_entities(tenant, kind, ts DESC);
+
+-- Remplacés par les index ci-dessus. wiki_rc_ts_idx existait en deux versions
+-- (ts ASC dans init.sql, ts DESC dans app/ingest.py) selon le script d'origine.
+DROP INDEX CONCURRENTLY IF EXISTS news_articles_kind_idx;
+DROP INDEX CONCURRENTLY IF EXISTS news_articles_tenant_kind_idx;
+DROP INDEX CONCURRENTLY IF EXISTS news_articles_published_idx;
+DROP INDEX CONCURRENTLY IF EXISTS wiki_rc_ts_idx;
+DROP INDEX CONCURRENTLY IF EXISTS wiki_rc_tenant_ts_idx;
+
+-- Tables en ajout seul : VACUUM plus fréquent pour garder la visibility map à
+-- jour, sans quoi les Index Only Scan retournent lire le heap.
+ALTER TABLE news_articles SET (autovacuum_vacuum_insert_scale_factor = 0.02);
+ALTER TABLE wiki_rc       SET (autovacuum_vacuum_insert_scale_factor = 0.02);
+VACUUM (ANALYZE) news_articles;
+VACUUM (ANALYZE) wiki_rc;
@@ -0,0 +1,26 @@
+-- Derniers articles / événements wiki pour le panneau "Flux direct" et read_api.
+-- Maintenues par db_writer à chaque flush (HOT_N lignes par tenant/kind) :
+-- lecture en O(N) quelle que soit la taille des grandes tables, sans croiser
+-- les écritures en masse. UNLOGGED : pas de WAL ; vidées après un crash de
+-- Postgres, db_writer les reconstruit au démarrage.
+CREATE UNLOGGED TABLE IF NOT EXISTS news_latest(
+  id BIGINT PRIMARY KEY,
+  tenant TEXT NOT NULL, kind TEXT NOT NULL,
+  published_ts TIMESTAMPTZ NOT NULL,
+  source TEXT, title TEXT, url TEXT
+) WITH (autovacuum_vacuum_scale_factor = 0, autovacuum_vacuum_threshold = 500);
+CREATE INDEX IF NOT EXISTS news_latest_idx ON news_latest(tenant, kind, published_ts DESC);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS wiki_latest(
+  id BIGINT PRIMARY KEY,
+  tenant TEXT NOT NULL,
+  ts TIMESTAMPTZ NOT NULL,
+  page TEXT, delta INT, url TEXT
+) WITH (autovacuum_vacuum_scale_factor = 0, autovacuum_vacuum_threshold = 500);
+CREATE INDEX IF NOT EXISTS wiki_latest_idx ON wiki_latest(tenant, ts DESC);
+
+-- db_writer les rafraîchit sur ts_ingest (avec une marge), pas sur l'id : un
+-- BIGSERIAL ne suit pas l'ordre des commits quand plusieurs écrivains tournent
+-- (app/ingest.py, réingestion, second db_writer).
+ALTER TABLE wiki_rc ADD COLUMN IF NOT EXISTS ts_ingest TIMESTAMPTZ NOT NULL DEFAULT NOW();
+CREATE INDEX IF NOT EXISTS wiki_rc_ingest_brin ON wiki_rc USING brin(ts_ingest) WITH (pages_per_range = 32);
@@ -0,0 +1,12 @@
+-- Tranches déjà recalculées par consumers/spike_aggregator/backfill.py.
+-- Une ligne par (job, tenant, heure), écrite dans la transaction qui remplace
+-- les spikes de la tranche : un backfill interrompu reprend où il s'était arrêté.
+CREATE TABLE IF NOT EXISTS backfill_checkpoints(
+  job TEXT NOT NULL,
+  tenant TEXT NOT NULL,
+  chunk TIMESTAMPTZ NOT NULL,
+  rows INT NOT NULL,
+  seconds DOUBLE PRECISION NOT NULL,
+  done_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY(job, tenant, chunk)
+);
@@ -1,9 +1,12 @@
-import os, json, time, hashlib, feedparser, requests
-from urllib.parse import urlparse
+import os, json, time
 from datetime import datetime, timezone
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import defaultdict
 from kafka import KafkaProducer
 from kafka.errors import NoBrokersAvailable
+from common.backpressure import Pressure
+from common.metrics import start_metrics_server, track_send
+from common.sources import RssSource, Scheduler, from_spec, load_specs
+from common.tenants import DEFAULT_TENANT, load_tenants
 
 BOOT        = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:29092")
 TOPIC       = os.getenv("TOPIC", "news_fr")
@@ -22,16 +25,15 @@ GDELT_QUERY = os.getenv("GDELT_QUERY", "sourceLanguage:French")
 MEDIASTACK_KEY   = os.getenv("MEDIASTACK_KEY", "")
 MEDIASTACK_LIMIT = int(os.getenv("MEDIASTACK_LIMIT", "50"))
 USE_MEDIASTACK   = bool(MEDIASTACK_KEY)
-
-
-UA = "TrendsRealtimeBot/1.0 (+github.com/yominax/trends-realtime; contact: you@example.com)"
-HDRS = {
-    "User-Agent": UA,
-    "Accept": "application/rss+xml, application/xml;q=0.9, text/xml;q=0.8, */*;q=0.7",
-}
+# Les API agrégées publient moins souvent que les flux RSS (et Mediastack a un quota)
+GDELT_POLL_SEC      = int(os.getenv("GDELT_POLL_SEC", "120"))
+MEDIASTACK_POLL_SEC = int(os.getenv("MEDIASTACK_POLL_SEC", "900"))
 
 def log(m): print(f"{datetime.now(timezone.utc).isoformat()} [news] {m}", flush=True)
 
+# état de db_writer + envois en vol : ralentit le scheduler quand l'aval sature
+PRESSURE = Pressure(log)
+
 def read_feeds(env, path):
     feeds = []
     if env.strip():
@@ -60,187 +62,66 @@ def kafka_producer_with_retry():
         except NoBrokersAvailable:
             log("Kafka pas prêt → retry 5s"); time.sleep(5)
 
-def norm_ts(entry):
-    for k in ("published_parsed","updated_parsed"):
-        v = getattr(entry, k, None)
-        if v:
-            return int(datetime(*v[:6], tzinfo=timezone.utc).timestamp())
-    return int(datetime.now(timezone.utc).timestamp())
-
-def fetch_bytes(url, timeout=20):
-    # suit les redirections proprement (évite les boucles 30x de feedparser)
-    r = requests.get(url, headers=HDRS, timeout=timeout, allow_redirects=True)
-    r.raise_for_status()
-    return r.content, r.headers.get("Content-Type","")
-
-def pull_feed(url, seen_hashes):
-    src = urlparse(url).netloc.replace("www.","")
-    out = []
-    try:
-        body, ctype = fetch_bytes(url)
-        # ne pas rejeter si le serveur renvoie text/html alors que c'est un RSS valide
-        d = feedparser.parse(body)
-        if d.bozo or not getattr(d, "entries", None):
-            return src, out, f"bozo={getattr(d,'bozo_exception',None)}"
-        for e in d.entries[:100]:
-            key = hashlib.md5((e.get("link","")+e.get("title","")).encode("utf-8")).hexdigest()
-            if key in seen_hashes: 
-                continue
-            seen_hashes.add(key)
-            out.append({
-                "published_ts": norm_ts(e),
-                "source": src,
-                "title": (e.get("title","") or "").strip(),
-                "url": e.get("link","") or "",
-                "summary": (e.get("summary","") or "")[:600]
-            })
-        if len(seen_hashes) > 3000:
-            seen_hashes.clear()
-        return src, out, None
-    except Exception as ex:
-        return src, out, str(ex)
-
-def pull_gdelt(seen_urls):
-    out = []
-    try:
-        params = {
-            "query": GDELT_QUERY,
-            "mode": "ArtList",
-            "format": "json",
-            "maxrecords": GDELT_MAX,
-            "sort": "DateDesc",
-        }
-        r = requests.get("https://api.gdeltproject.org/api/v2/doc/doc", params=params, headers=HDRS, timeout=20)
-        r.raise_for_status()
-        data = r.json()
-        for art in data.get("articles", []):
-            url = art.get("url") or ""
-            if not url or url in seen_urls:
-                continue
-            seen_urls.add(url)
-            ts = art.get("seendate")
-            if ts:
-                try:
-                    ts = int(datetime.strptime(ts, "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc).timestamp())
-                except Exception:
-                    ts = int(datetime.now(timezone.utc).timestamp())
-            else:
-                ts = int(datetime.now(timezone.utc).timestamp())
-            out.append({
-                "published_ts": ts,
-                "source": urlparse(url).netloc.replace("www.", ""),
-                "title": (art.get("title", "") or "").strip(),
-                "url": url,
-                "summary": (art.get("excerpt", "") or "")[:600],
-            })
-        if len(seen_urls) > 5000:
-            seen_urls.clear()
-        return out, None
-    except Exception as ex:
-        return out, str(ex)
-
-
-def pull_mediastack(seen_urls):
-
-    out = []
-    try:
-        params = {
-            "access_key": MEDIASTACK_KEY,
-            "languages": "fr",
-            "limit": MEDIASTACK_LIMIT,
-            "sort": "published_desc",
-        }
-        r = requests.get("http://api.mediastack.com/v1/news", params=params, headers=HDRS, timeout=20)
-        r.raise_for_status()
-        data = r.json()
-        for art in data.get("data", []):
-            url = art.get("url") or ""
-            if not url or url in seen_urls:
-                continue
-            seen_urls.add(url)
-            ts = art.get("published_at")
-            if ts:
-                try:
-                    ts = int(datetime.strptime(ts, "%Y-%m-%dT%H:%M:%S%z").timestamp())
-                except Exception:
-                    ts = int(datetime.now(timezone.utc).timestamp())
-            else:
-                ts = int(datetime.now(timezone.utc).timestamp())
-            out.append({
-                "published_ts": ts,
-                "source": urlparse(url).netloc.replace("www.", ""),
-                "title": (art.get("title", "") or "").strip(),
-                "url": url,
-                "summary": (art.get("description", "") or "")[:600],
-            })
-        if len(seen_urls) > 5000:
-            seen_urls.clear()
-        return out, None
-    except Exception as ex:
-        return out, str(ex)
-
+def send(prod, tenant, kind, rec):
+    rec = dict(rec, kind=kind, tenant=tenant["tenant"])
+    topic = tenant["news"]["topic"]
+    fut = prod.send(topic, rec, key=tenant["tenant"].encode("utf-8"))
+    track_send(fut, topic)
+    PRESSURE.track(fut)
+
+def default_tenant():
+    # configuration historique (un seul marché, variables d'env)
+    return {"tenant": DEFAULT_TENANT, "lang": "fr", "gdelt": USE_GDELT, "mediastack": USE_MEDIASTACK,
+            "news": {"topic": TOPIC, "feeds_une": FEEDS_UNE_FILE, "feeds_cont": FEEDS_CONT_FILE,
+                     "feeds_une_env": FEEDS_UNE, "feeds_cont_env": FEEDS_CONT}}
+
+def default_specs():
+    # sources API historiques, activées par les variables d'env
+    specs = []
+    if USE_GDELT:
+        specs.append({"type": "gdelt", "kind": "une", "interval": GDELT_POLL_SEC,
+                      "query": GDELT_QUERY, "maxrecords": GDELT_MAX})
+    if USE_MEDIASTACK:
+        specs.append({"type": "mediastack", "kind": "une", "interval": MEDIASTACK_POLL_SEC,
+                      "key": MEDIASTACK_KEY, "limit": MEDIASTACK_LIMIT})
+    return specs
+
+def build_sources(tenants):
+    """Sources -> tenants abonnés : un flux partagé n'est récupéré qu'une fois."""
+    by_name = {t["tenant"]: t for t in tenants}
+    subs = defaultdict(list)
+    for t in tenants:
+        n = t["news"]
+        for kind, key in (("une", "feeds_une"), ("continu", "feeds_cont")):
+            if n.get(key) or n.get(key + "_env"):
+                for u in read_feeds(n.get(key + "_env", ""), n.get(key, "")):
+                    subs[(u, kind)].append(t)
+    routes = {RssSource(u, kind=kind, interval=POLL_SEC): ts for (u, kind), ts in subs.items()}
+    for spec in load_specs(default_specs()):
+        src = from_spec(spec)
+        if src.tenants is not None:
+            routes[src] = [by_name[name] for name in src.tenants if name in by_name]
+        else:   # GDELT / Mediastack : tenants qui activent ce type
+            routes[src] = [t for t in tenants if t.get(src.type)]
+    return {src: ts for src, ts in routes.items() if ts}
 
 def main():
+    start_metrics_server()
     prod = kafka_producer_with_retry()
-    feeds_une = read_feeds(FEEDS_UNE, FEEDS_UNE_FILE)
-    feeds_cont = read_feeds(FEEDS_CONT, FEEDS_CONT_FILE)
-    log(f"{len(feeds_une)} flux 'une', {len(feeds_cont)} flux continu")
-
-
-    last_hash_une = {u: set() for u in feeds_une}
-    last_hash_cont = {u: set() for u in feeds_cont}
-    gdelt_seen = set()
-    mediastack_seen = set()
-
-
-    while True:
-        pushed_total = 0
-        # Flux UNE
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
-            futures = {ex.submit(pull_feed, u, last_hash_une[u]): u for u in feeds_une}
-            for fut in as_completed(futures):
-                src, recs, err = fut.result()
-                if err:
-                    log(f"{src} invalide: {err}")
-                    continue
-                for r in recs:
-                    r["kind"] = "une"
-                    prod.send(TOPIC, r)
-                pushed_total += len(recs)
-        # Flux continu
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
-            futures = {ex.submit(pull_feed, u, last_hash_cont[u]): u for u in feeds_cont}
-            for fut in as_completed(futures):
-                src, recs, err = fut.result()
-                if err:
-                    log(f"{src} invalide: {err}")
-                    continue
-                for r in recs:
-                    r["kind"] = "continu"
-                    prod.send(TOPIC, r)
-                pushed_total += len(recs)
-        if USE_GDELT:
-            recs, err = pull_gdelt(gdelt_seen)
-            if err:
-                log(f"gdelt invalide: {err}")
-            else:
-                for r in recs:
-                    r["kind"] = "une"
-                    prod.send(TOPIC, r)
-                pushed_total += len(recs)
-        if USE_MEDIASTACK:
-            recs, err = pull_mediastack(mediastack_seen)
-            if err:
-                log(f"mediastack invalide: {err}")
-            else:
-                for r in recs:
-                    r["kind"] = "une"
-                    prod.send(TOPIC, r)
-                pushed_total += len(recs)
-
-        if pushed_total:
-            log(f"+{pushed_total} articles")
-        time.sleep(POLL_SEC)
+    tenants = [t for t in load_tenants(default_tenant()) if t.get("news")]
+    routes = build_sources(tenants)
+    n_rss = sum(1 for s in routes if isinstance(s, RssSource))
+    log(f"{len(tenants)} tenant(s), {n_rss} flux RSS, autres sources : "
+        f"{', '.join(s.name for s in routes if not isinstance(s, RssSource)) or '-'}")
+
+    def emit(src, recs):
+        for t in routes[src]:
+            for r in recs:
+                send(prod, t, src.kind, r)
+        log(f"{src.name} +{len(recs)} articles")
+
+    # un seul pool pour toutes les sources de tous les tenants, chacune à son rythme
+    Scheduler(routes, emit, workers=MAX_WORKERS, log=log, pressure=PRESSURE.start()).run()
 
 if __name__ == "__main__":
     main()
@@ -1,39 +1,26 @@
-import os, time, json, requests
-from datetime import datetime, timezone, timedelta
+import os, re, time, json
+from datetime import datetime, timezone
 from kafka import KafkaProducer
 from kafka.errors import NoBrokersAvailable
+from common.backpressure import Pressure
+from common.metrics import start_metrics_server, track_send
+from common.sources import Scheduler, WikiSource
+from common.tenants import DEFAULT_TENANT, load_tenants
 
 BOOT   = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:29092")
 TOPIC  = os.getenv("TOPIC", "wiki_rc")
-LANG   = os.getenv("LANG", "fr")
 POLL_S = int(os.getenv("POLL_SEC", "5"))
-WIKI_DOMAIN = {"fr": "fr.wikipedia.org", "en": "en.wikipedia.org"}.get(LANG, "fr.wikipedia.org")
-
-S = requests.Session()
-S.headers.update({
-    "User-Agent": "TrendsRealtimeBot/1.0 (+https://github.com/yominax/trends-realtime; contact: you@example.com)",
-    "Accept": "application/json"
-})
+# LANG est aussi la locale POSIX (C.UTF-8, en_US.UTF-8…) : gardé en repli seulement
+LANG   = os.getenv("WIKI_LANG") or os.getenv("LANG", "fr")
+LANG_RE = re.compile(r"^[a-z-]{2,12}$")
 
 def log(msg): print(f"{datetime.now(timezone.utc).isoformat()} [wiki-rc] {msg}", flush=True)
 
-def fetch(rcstart=None, rccontinue=None):
-    url = f"https://{WIKI_DOMAIN}/w/api.php"
-    params = {
-        "action": "query", "format": "json", "list": "recentchanges",
-        "rcprop": "title|user|comment|timestamp|sizes",
-        "rcnamespace": "0",
-        "rctype": "edit|new",
-        "rcshow": "!bot",
-        "rclimit": "50",         # rester raisonnable
-        "rcdir": "newer",
-        "origin": "*"
-    }
-    if rccontinue: params["rccontinue"] = rccontinue
-    elif rcstart:  params["rcstart"] = rcstart
-    r = S.get(url, params=params, timeout=20)
-    r.raise_for_status()
-    return r.json()
+def wiki_domain(lang):
+    if not LANG_RE.match(lang or ""):
+        log(f"langue wiki invalide {lang!r} → fr")
+        lang = "fr"
+    return f"{lang}.wikipedia.org"
 
 def kafka_producer_with_retry():
     while True:
@@ -47,26 +34,28 @@ def kafka_producer_with_retry():
             log("Kafka pas prêt → nouvel essai dans 5s"); time.sleep(5)
 
 def main():
+    start_metrics_server()
     prod = kafka_producer_with_retry()
-    start_iso = (datetime.now(timezone.utc) - timedelta(seconds=60)).strftime("%Y-%m-%dT%H:%M:%SZ")
-    rccont = None
-    while True:
-        try:
-            data = fetch(rcstart=start_iso if not rccont else None, rccontinue=rccont)
-            for rc in data.get("query", {}).get("recentchanges", []):
-                newlen = rc.get("newlen") or 0; oldlen = rc.get("oldlen") or 0
-                rec = {
-                    "page": rc.get("title"),
-                    "ts": int(datetime.fromisoformat(rc["timestamp"].replace("Z","+00:00")).timestamp()),
-                    "user": rc.get("user"), "comment": rc.get("comment"),
-                    "delta": int(newlen - oldlen),
-                    "url": f"https://{WIKI_DOMAIN}/wiki/{(rc.get('title') or '').replace(' ', '_')}"
-                }
-                prod.send(TOPIC, rec)
-            rccont = data.get("continue", {}).get("rccontinue", rccont)
-            time.sleep(POLL_S)
-        except Exception as e:
-            log(f"error {e} → retry 5s"); time.sleep(5)
+    default = {"tenant": DEFAULT_TENANT, "lang": LANG, "wiki": {"topic": TOPIC}}
+    # domaine -> tenants abonnés : un wiki partagé n'est interrogé qu'une fois par cycle
+    by_domain = {}
+    for t in load_tenants(default):
+        if t.get("wiki"):
+            by_domain.setdefault(wiki_domain(t["lang"]), []).append(t)
+    log(f"{len(by_domain)} wiki(s) : {', '.join(by_domain)}")
+    pressure = Pressure(log).start()
+
+    def emit(src, recs):
+        for t in by_domain[src.domain]:
+            topic = t["wiki"]["topic"]
+            for rec in recs:
+                fut = prod.send(topic, dict(rec, tenant=t["tenant"]), key=t["tenant"].encode("utf-8"))
+                track_send(fut, topic)
+                pressure.track(fut)
+
+    sources = [WikiSource(domain, interval=POLL_S) for domain in by_domain]
+    # rccontinue : un intervalle allongé ne perd rien, les modifications attendent
+    Scheduler(sources, emit, workers=max(len(sources), 1), log=log, pressure=pressure).run()
 
 if __name__ == "__main__":
     main()